@@ -0,0 +1,61 @@
+"""Пропускная способность импорта пользователей (users/s).
+
+Сравнивает POST /users/ по одному и POST /users/bulk (NDJSON) на сгенерированных данных.
+--users делятся на запросы по --chunk строк (не больше BULK_MAX_ROWS сервиса).
+
+Запуск (user-service из docker-compose на localhost:8001):
+    python bench/bulk_import.py --users 10000 --chunk 1000 --single 200 --username admin --password secret
+"""
+import argparse
+import json
+import time
+import uuid
+
+from common import USER_SERVICE_URL, get_token, request
+
+
+def generate_users(count):
+    prefix = uuid.uuid4().hex[:6]
+    for i in range(count):
+        username = f"bench{prefix}{i}"
+        yield {
+            "username": username,
+            "password": "password",
+            "first_name": "Bench",
+            "last_name": f"User{i}",
+            "email": f"{username}@example.com",
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--chunk", type=int, default=1000, help="строк в одном POST /users/bulk")
+    parser.add_argument("--single", type=int, default=200, help="сколько пользователей создать по одному")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    args = parser.parse_args()
+
+    token = get_token(args.username, args.password)
+
+    started = time.perf_counter()
+    for user in generate_users(args.single):
+        request(USER_SERVICE_URL + "/users/", json.dumps(user).encode(), {"Content-Type": "application/json"})
+    single_elapsed = time.perf_counter() - started
+    print(f"POST /users/     {args.single / single_elapsed:8.1f} users/s")
+
+    users = [json.dumps(user) for user in generate_users(args.users)]
+    headers = {"Content-Type": "application/x-ndjson", "Authorization": f"Bearer {token}"}
+    created = failed = 0
+    started = time.perf_counter()
+    for start in range(0, len(users), args.chunk):
+        body = "\n".join(users[start:start + args.chunk]).encode()
+        result = request(USER_SERVICE_URL + "/users/bulk", body, headers)
+        created += result["created"]
+        failed += result["failed"]
+    bulk_elapsed = time.perf_counter() - started
+    print(f"POST /users/bulk {created / bulk_elapsed:8.1f} users/s (created={created}, failed={failed})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""CPU на одно попадание в кеш для GET /users/{user_id}.
+
+old - json.loads -> UserResponse -> проверка response_model -> JSONResponse (как было);
+raw - готовые байты из кеша сразу в Response (текущий user_service).
+
+Запуск:
+    python bench/cache_hit_serialization.py --iterations 100000
+"""
+import argparse
+import json
+import timeit
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+
+class UserResponse(BaseModel):
+    id: int
+    username: str
+    first_name: str
+    last_name: str
+    email: str
+
+
+RAW = orjson.dumps({
+    "id": 1,
+    "username": "nantognazzi0",
+    "first_name": "Nadean",
+    "last_name": "Antognazzi",
+    "email": "nantognazzi0@tripadvisor.com",
+})
+
+
+def old_path():
+    user = UserResponse(**json.loads(RAW))
+    # так FastAPI обрабатывает возвращённую модель при заданном response_model
+    validated = UserResponse.validate(user)
+    return JSONResponse(jsonable_encoder(validated)).body
+
+
+def raw_path():
+    return Response(content=RAW, media_type="application/json").body
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    assert json.loads(old_path()) == json.loads(raw_path())
+    for name, path in [("old", old_path), ("raw", raw_path)]:
+        seconds = timeit.timeit(path, number=args.iterations)
+        print(f"{name}: {seconds / args.iterations * 1e6:7.2f} us/hit")
+
+
+if __name__ == "__main__":
+    main()
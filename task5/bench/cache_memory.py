@@ -0,0 +1,88 @@
+"""Сколько байт Redis занимает один закешированный пользователь.
+
+Записывает --users ключей user:id:* в каждом формате (json, msgpack, с zlib и без)
+и выводит MEMORY USAGE на ключ, прирост used_memory на пользователя и CPU на
+разбор значения при попадании в L2. Кодирование и разбор повторяют
+encode_value/decode_value из user_service: json отдаётся как есть, msgpack
+на каждом попадании превращается обратно в JSON-тело ответа.
+
+Запуск (redis из docker-compose на localhost:6379):
+    python bench/cache_memory.py --users 10000
+"""
+import argparse
+import os
+import timeit
+import zlib
+
+import msgpack
+import orjson
+import redis
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+USER_FIELDS = ("id", "username", "first_name", "last_name", "email")
+
+
+def encode(user, encoding, compress):
+    if encoding == "msgpack":
+        raw = b"m" + msgpack.packb([user[field] for field in USER_FIELDS])
+    else:
+        raw = orjson.dumps(user)
+    if compress:
+        raw = b"z" + zlib.compress(raw)
+    return raw
+
+
+def decode(raw):
+    if raw[:1] == b"z":
+        raw = zlib.decompress(raw[1:])
+    if raw[:1] == b"m":
+        return orjson.dumps(dict(zip(USER_FIELDS, msgpack.unpackb(raw[1:]))))
+    return raw
+
+
+def make_user(i):
+    username = f"user{i}"
+    return {
+        "id": i,
+        "username": username,
+        "first_name": "Nadean",
+        "last_name": "Antognazzi",
+        "email": f"{username}@tripadvisor.com",
+    }
+
+
+def measure(client, users, encoding, compress):
+    before = client.info("memory")["used_memory"]
+    pipe = client.pipeline(transaction=False)
+    for i in range(users):
+        pipe.set(f"bench:user:id:{i}", encode(make_user(i), encoding, compress), ex=3600)
+    pipe.execute()
+    after = client.info("memory")["used_memory"]
+    sample = [client.memory_usage(f"bench:user:id:{i}") for i in range(0, users, max(users // 100, 1))]
+    value = len(encode(make_user(users // 2), encoding, compress))
+    keys = [key for key in client.scan_iter("bench:*", count=1000)]
+    for start in range(0, len(keys), 1000):
+        client.delete(*keys[start:start + 1000])
+    raw = encode(make_user(users // 2), encoding, compress)
+    decode_us = min(timeit.repeat(lambda: decode(raw), number=10000, repeat=5)) / 10000 * 1e6
+    return value, sum(sample) / len(sample), (after - before) / users, decode_us
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10000)
+    args = parser.parse_args()
+
+    client = redis.from_url(REDIS_URL)
+    print(f"{'format':>12} {'value':>7} {'MEMORY USAGE':>13} {'used_memory/user':>17} {'decode us':>10}")
+    for encoding in ("json", "msgpack"):
+        for compress in (False, True):
+            name = encoding + ("+zlib" if compress else "")
+            value, usage, per_user, decode_us = measure(client, args.users, encoding, compress)
+            print(f"{name:>12} {value:>7} {usage:>13.1f} {per_user:>17.1f} {decode_us:>10.2f}")
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
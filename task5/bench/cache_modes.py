@@ -0,0 +1,70 @@
+"""wrk по всем режимам кеша одного и того же user-service.
+
+Для каждого режима (PUT /admin/cache-mode) запускает wrk с 1, 5 и 10 потоками
+и печатает таблицы Average latency и Total requests в формате readme.
+С --update-readme таблицы в readme.md заменяются результатами.
+
+Запуск (user-service из docker-compose на localhost:8001, wrk в PATH):
+    python bench/cache_modes.py --username admin --password secret --update-readme
+
+Пользователь должен входить в ADMIN_USERNAMES user-service.
+"""
+import argparse
+import json
+import os
+import re
+
+from common import USER_SERVICE_URL, get_token, render_table, request, run_wrk
+
+README = os.path.join(os.path.dirname(__file__), "..", "readme.md")
+
+MODES = ["off", "read-through", "write-through", "write-behind"]
+
+
+def set_mode(token, mode):
+    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {token}"}
+    request(USER_SERVICE_URL + "/admin/cache-mode", json.dumps({"mode": mode}).encode(), headers, "PUT")
+
+
+def update_readme(latency_table, requests_table):
+    with open(README, encoding="utf-8") as f:
+        text = f.read()
+    for title, table in [("Average latency:", latency_table), ("Total requests:", requests_table)]:
+        text = re.sub(rf"({re.escape(title)}\n\n)(\|.*\n)+", lambda match: match.group(1) + table + "\n", text, count=1)
+    with open(README, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--path", default="/users/1")
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--connections", type=int, default=15)
+    parser.add_argument("--duration", type=int, default=10)
+    parser.add_argument("--update-readme", action="store_true")
+    args = parser.parse_args()
+
+    token = get_token(args.username, args.password)
+    initial_mode = request(USER_SERVICE_URL + "/admin/cache-mode", headers={"Authorization": f"Bearer {token}"})["mode"]
+    url = USER_SERVICE_URL + args.path
+    results = {}
+    for mode in args.modes:
+        set_mode(token, mode)
+        # прогрев, чтобы в режимах с кешем замерялись попадания
+        run_wrk(token, url, 1, 1, 1)
+        results[mode] = {count: run_wrk(token, url, count, args.connections, args.duration)
+                         for count in args.threads}
+    set_mode(token, initial_mode)
+
+    latency_table = render_table(results, 0, args.modes, args.threads)
+    requests_table = render_table(results, 1, args.modes, args.threads)
+    print("Average latency:\n\n" + latency_table + "\n\nTotal requests:\n\n" + requests_table)
+    if args.update_readme:
+        update_readme(latency_table, requests_table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Задержка записи в кеш при создании и удалении пользователя.
+
+before - отдельные команды, как раньше делали create_user/delete_user;
+after  - один MULTI/EXEC pipeline, как в cache_write_through.
+
+Запуск (redis из docker-compose на localhost:6379):
+    python bench/cache_writes.py --iterations 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+import redis.asyncio as aioredis
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+USER = {"id": 0, "username": "bench", "first_name": "Bench", "last_name": "User", "email": "bench@example.com"}
+
+
+async def create_before(client, i):
+    raw = json.dumps({**USER, "id": i})
+    await client.set(f"bench:user:id:{i}", raw, ex=3600)
+    await client.delete("bench:users:all")
+
+
+async def delete_before(client, i):
+    await client.delete(f"bench:user:id:{i}")
+    await client.delete(f"bench:user:username:bench{i}")
+    await client.delete("bench:users:all")
+
+
+async def create_after(client, i):
+    raw = json.dumps({**USER, "id": i})
+    async with client.pipeline(transaction=True) as pipe:
+        pipe.set(f"bench:user:id:{i}", raw, ex=3600)
+        pipe.set(f"bench:user:username:bench{i}", raw, ex=3600)
+        pipe.incr("bench:cache:gen:users")
+        pipe.publish("bench:cache:invalidate", json.dumps([f"bench:user:id:{i}", f"bench:user:username:bench{i}"]))
+        await pipe.execute()
+
+
+async def delete_after(client, i):
+    async with client.pipeline(transaction=True) as pipe:
+        pipe.delete(f"bench:auth:user:bench{i}")
+        pipe.set(f"bench:user:id:{i}", "!missing", ex=60)
+        pipe.set(f"bench:user:username:bench{i}", "!missing", ex=60)
+        pipe.incr("bench:cache:gen:users")
+        pipe.publish("bench:cache:invalidate", json.dumps([f"bench:user:id:{i}", f"bench:user:username:bench{i}"]))
+        await pipe.execute()
+
+
+async def measure(client, operation, iterations):
+    latencies = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        await operation(client, i)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return statistics.mean(latencies) * 1000, latencies[int(len(latencies) * 0.99) - 1] * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    client = aioredis.from_url(REDIS_URL)
+    for name, operation in [("create before", create_before), ("create after", create_after),
+                            ("delete before", delete_before), ("delete after", delete_after)]:
+        avg, p99 = await measure(client, operation, args.iterations)
+        print(f"{name:14} avg={avg:6.3f}ms p99={p99:6.3f}ms")
+
+    keys = [key async for key in client.scan_iter("bench:*")]
+    if keys:
+        await client.delete(*keys)
+    await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
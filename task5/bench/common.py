@@ -0,0 +1,52 @@
+"""Общие помощники bench-скриптов: HTTP-запросы, токен user-service и wrk.
+
+Скрипты запускаются как python bench/<имя>.py, поэтому каталог bench уже
+лежит в sys.path и модуль импортируется как common.
+"""
+import json
+import re
+import subprocess
+import urllib.parse
+import urllib.request
+
+USER_SERVICE_URL = "http://localhost:8001"
+UNITS_MS = {"us": 0.001, "ms": 1.0, "s": 1000.0}
+
+
+def request(url, body=None, headers=None, method=None):
+    req = urllib.request.Request(url, data=body, method=method, headers=headers or {})
+    with urllib.request.urlopen(req) as response:
+        return json.loads(response.read() or b"null")
+
+
+def get_token(username, password, base_url=USER_SERVICE_URL):
+    body = urllib.parse.urlencode({"username": username, "password": password}).encode()
+    response = request(base_url + "/token", body, {"Content-Type": "application/x-www-form-urlencoded"})
+    return response["access_token"]
+
+
+def run_wrk(token, url, threads, connections, duration):
+    """Возвращает (Average latency в мс, Total requests, Requests/sec)."""
+    output = subprocess.run(
+        ["wrk", f"-t{threads}", f"-c{connections}", f"-d{duration}s",
+         "-H", f"Authorization: Bearer {token}", url],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    value, unit = re.search(r"Latency\s+([\d.]+)(us|ms|s)", output).groups()
+    requests_total = int(re.search(r"(\d+) requests in", output).group(1))
+    requests_per_sec = float(re.search(r"Requests/sec:\s+([\d.]+)", output).group(1))
+    return float(value) * UNITS_MS[unit], requests_total, requests_per_sec
+
+
+def render_table(results, column, names, rows, title="Threads", digits=2):
+    """Таблица в формате readme: строка на каждое значение rows, столбец на каждое имя."""
+    lines = [
+        f"| {title}  | " + " | ".join(names) + " |",
+        "|:-------------: |" + "|".join(":-------------:" for _ in names) + "|",
+    ]
+    for row in rows:
+        cells = [results[name][row][column] for name in names]
+        lines.append(f"| {row}         | " + " | ".join(
+            f"{cell:.{digits}f}" if isinstance(cell, float) else str(cell) for cell in cells
+        ) + " |")
+    return "\n".join(lines)
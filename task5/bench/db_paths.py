@@ -0,0 +1,94 @@
+"""Сравнение синхронного и асинхронного доступа к PostgreSQL из async-обработчика.
+
+sync  - блокирующий Session внутри корутины (как было в user_service);
+async - AsyncSession + asyncpg с пулом соединений (текущий user_service).
+
+Запуск (postgres из docker-compose проброшен на localhost:5432):
+    python bench/db_paths.py --concurrency 50 --requests 2000 --slow-ms 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+DB_USER = os.getenv("DB_USER", "postgres")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "postgres")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "5432")
+DB_NAME = os.getenv("DB_NAME", "user_service")
+
+DSN = f"{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+QUERY = text(
+    "SELECT id, username, first_name, last_name, email, pg_sleep(:delay) "
+    "FROM users WHERE id = :user_id"
+)
+
+
+async def run_sync(args):
+    engine = create_engine(f"postgresql+psycopg2://{DSN}", pool_size=args.pool_size)
+    latencies = []
+
+    async def worker(n):
+        for i in range(n):
+            started = time.perf_counter()
+            with engine.connect() as conn:
+                conn.execute(QUERY, {"delay": args.slow_ms / 1000, "user_id": i % 100 + 1}).first()
+            latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(0)
+
+    elapsed = await run_workers(worker, args)
+    engine.dispose()
+    return elapsed, latencies
+
+
+async def run_async(args):
+    engine = create_async_engine(f"postgresql+asyncpg://{DSN}", pool_size=args.pool_size)
+    latencies = []
+
+    async def worker(n):
+        for i in range(n):
+            started = time.perf_counter()
+            async with engine.connect() as conn:
+                (await conn.execute(QUERY, {"delay": args.slow_ms / 1000, "user_id": i % 100 + 1})).first()
+            latencies.append(time.perf_counter() - started)
+
+    elapsed = await run_workers(worker, args)
+    await engine.dispose()
+    return elapsed, latencies
+
+
+async def run_workers(worker, args):
+    per_worker = args.requests // args.concurrency
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(per_worker) for _ in range(args.concurrency)))
+    return time.perf_counter() - started
+
+
+def report(name, elapsed, latencies):
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(
+        f"{name:6} rps={len(latencies) / elapsed:8.1f} "
+        f"avg={statistics.mean(latencies) * 1000:7.2f}ms p99={p99 * 1000:7.2f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--pool-size", type=int, default=20)
+    parser.add_argument("--slow-ms", type=float, default=0, help="искусственная задержка запроса через pg_sleep")
+    args = parser.parse_args()
+
+    report("sync", *await run_sync(args))
+    report("async", *await run_async(args))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+"""Конкурентные PATCH /trips/{id}/join на одну поездку.
+
+Создаёт поездку с --seats местами и одновременно отправляет --joins запросов
+на присоединение от разных пользователей (каждый --duplicate-every-й повторяет
+предыдущего). Печатает число успешных присоединений, итоговый user_ids,
+превышение мест и p50/p99 латентности.
+Старый join (find_one -> проверка в Python -> update_one -> find_one) при гонке
+пускает больше пассажиров, чем мест; атомарный find_one_and_update – нет.
+
+Запуск (user-service на localhost:8001 выдаёт токен, trip-service на localhost:8002):
+    python bench/join_contention.py --username admin --password secret --joins 500 --seats 3
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.error
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from common import get_token, request
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--base-url", default="http://localhost:8002")
+    parser.add_argument("--joins", type=int, default=500)
+    parser.add_argument("--seats", type=int, default=3)
+    parser.add_argument("--duplicate-every", type=int, default=10)
+    args = parser.parse_args()
+
+    token = get_token(args.username, args.password)
+    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {token}"}
+    trip = request(args.base_url + "/trips/", json.dumps({
+        "route_id": 1,
+        "driver_id": 1,
+        "start_location": "Москва",
+        "end_location": "Тверь",
+        "departure_time": "2030-01-01T08:00:00",
+        "available_seats": args.seats,
+        "price": 500,
+    }).encode(), headers)
+    trip_url = f"{args.base_url}/trips/{trip['id']}"
+
+    start = threading.Barrier(args.joins)
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def join(n):
+        user_id = n if args.duplicate_every <= 0 or n % args.duplicate_every else n - 1
+        body = json.dumps({"user_id": user_id + 1000}).encode()
+        start.wait()
+        started = time.perf_counter()
+        try:
+            request(trip_url + "/join", body, headers, "PATCH")
+            code = 200
+        except urllib.error.HTTPError as e:
+            code = f"{e.code} {json.loads(e.read())['detail']}"
+        with lock:
+            latencies.append(time.perf_counter() - started)
+            statuses[code] += 1
+
+    with ThreadPoolExecutor(max_workers=args.joins) as pool:
+        list(pool.map(join, range(1, args.joins + 1)))
+
+    user_ids = request(trip_url, headers=headers)["user_ids"]
+    request(trip_url, headers=headers, method="DELETE")
+    latencies.sort()
+    print("responses:", dict(statuses))
+    print(f"seats={args.seats} joined={len(user_ids)} unique={len(set(user_ids))} "
+          f"overbooked={max(len(user_ids) - args.seats, 0)}")
+    print(f"p50={statistics.median(latencies) * 1000:.2f}ms "
+          f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Латентность поиска по маске имени на растущей таблице.
+
+Скрипт заполняет отдельную таблицу users_bench (копия структуры и индексов users)
+сгенерированными пользователями и после каждого шага замеряет запрос,
+который выполняет GET /users/by-name/{name_mask}, с индексами pg_trgm и без них.
+Маски из 1-2 символов замеряются отдельно: сервис ищет их только по префиксу
+(PREFIX_SQL), а в колонке "short old" для сравнения p99 того же запроса, что и
+для длинных масок: триграмм в короткой маске нет, и он читает все совпадения.
+
+Запуск:
+    python bench/name_search.py --sizes 100000 1000000 3000000 --queries 200
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+
+import psycopg2
+
+DB_USER = os.getenv("DB_USER", "postgres")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "postgres")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "5432")
+DB_NAME = os.getenv("DB_NAME", "user_service")
+
+SYLLABLES = ["an", "bel", "cor", "dan", "el", "fi", "gor", "har", "is", "jo", "ka", "lin",
+             "mar", "nik", "ol", "pet", "ra", "sem", "tor", "ul", "val", "yan", "zak", "mi"]
+
+SEARCH_SQL = """
+SELECT id, username, first_name, last_name, email
+FROM users_bench
+WHERE first_name ILIKE %(contains)s OR last_name ILIKE %(contains)s
+   OR %(mask)s <%% first_name OR %(mask)s <%% last_name
+ORDER BY CASE WHEN first_name ILIKE %(prefix)s OR last_name ILIKE %(prefix)s THEN 1 ELSE 0 END DESC,
+         greatest(word_similarity(%(mask)s, first_name), word_similarity(%(mask)s, last_name)) DESC,
+         id
+LIMIT %(limit)s
+"""
+
+PREFIX_SQL = """
+SELECT * FROM (
+    (SELECT id, username, first_name, last_name, email, lower(first_name) COLLATE "C" AS sort_key
+     FROM users_bench WHERE lower(first_name) COLLATE "C" LIKE %(prefix)s
+     ORDER BY lower(first_name) COLLATE "C", id LIMIT %(limit)s)
+    UNION ALL
+    (SELECT id, username, first_name, last_name, email, lower(last_name) COLLATE "C" AS sort_key
+     FROM users_bench WHERE lower(last_name) COLLATE "C" LIKE %(prefix)s
+     ORDER BY lower(last_name) COLLATE "C", id LIMIT %(limit)s)
+) AS matches
+ORDER BY sort_key, id
+LIMIT 2 * %(limit)s
+"""
+
+NAME_SQL = "initcap({s}[1 + floor(random() * {n})::int] || {s}[1 + floor(random() * {n})::int] || {s}[1 + floor(random() * {n})::int])"
+
+
+def seed(cur, start, stop):
+    syllables = "(ARRAY[" + ",".join(f"'{s}'" for s in SYLLABLES) + "])"
+    name = NAME_SQL.format(s=syllables, n=len(SYLLABLES))
+    cur.execute(f"""
+        INSERT INTO users_bench (id, username, password, first_name, last_name, email)
+        SELECT i, 'bench' || i, 'x', {name}, {name}, 'bench' || i || '@example.com'
+        FROM generate_series(%s, %s) AS i
+    """, (start + 1, stop))
+    cur.execute("ANALYZE users_bench")
+
+
+def random_mask():
+    mask = "".join(random.choice(SYLLABLES) for _ in range(2))
+    if random.random() < 0.3:
+        # опечатка: выкидываем одну букву
+        pos = random.randrange(len(mask))
+        mask = mask[:pos] + mask[pos + 1:]
+    return mask
+
+
+def random_short_mask():
+    return random.choice(SYLLABLES)[:random.randint(1, 2)]
+
+
+def measure(cur, queries, limit, sql=SEARCH_SQL, make_mask=random_mask):
+    latencies = []
+    for _ in range(queries):
+        mask = make_mask()
+        prefix = mask.lower() if sql is PREFIX_SQL else mask
+        params = {"mask": mask, "contains": f"%{mask}%", "prefix": f"{prefix}%", "limit": limit}
+        started = time.perf_counter()
+        cur.execute(sql, params)
+        cur.fetchall()
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return statistics.median(latencies) * 1000, latencies[int(len(latencies) * 0.99) - 1] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000, 3000000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--no-seqscan", action="store_true", help="не замерять вариант без индексов")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT, dbname=DB_NAME)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("DROP TABLE IF EXISTS users_bench")
+    cur.execute("CREATE TABLE users_bench (LIKE users INCLUDING INDEXES)")
+
+    rows = 0
+    print(f"{'rows':>10} {'trgm p50':>10} {'trgm p99':>10} {'seq p50':>10} {'seq p99':>10} "
+          f"{'short p50':>10} {'short p99':>10} {'short old':>10}")
+    for size in sorted(args.sizes):
+        seed(cur, rows, size)
+        rows = size
+
+        trgm = measure(cur, args.queries, args.limit)
+        short = measure(cur, args.queries, args.limit, PREFIX_SQL, random_short_mask)
+        short_trgm = measure(cur, max(args.queries // 10, 5), args.limit, SEARCH_SQL, random_short_mask)
+        seq = (float("nan"), float("nan"))
+        if not args.no_seqscan:
+            cur.execute("SET enable_bitmapscan = off")
+            cur.execute("SET enable_indexscan = off")
+            seq = measure(cur, max(args.queries // 10, 5), args.limit)
+            cur.execute("RESET enable_bitmapscan")
+            cur.execute("RESET enable_indexscan")
+        print(f"{rows:>10} {trgm[0]:>10.2f} {trgm[1]:>10.2f} {seq[0]:>10.2f} {seq[1]:>10.2f} "
+              f"{short[0]:>10.2f} {short[1]:>10.2f} {short_trgm[1]:>10.2f}")
+
+    cur.execute("DROP TABLE users_bench")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
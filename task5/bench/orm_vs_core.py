@@ -0,0 +1,116 @@
+"""Поиск пользователя: ORM против заранее собранных Core-запросов.
+
+orm  - select(UserModel) с гидрацией всей модели (как было в get_user/read_user);
+core - select нужных колонок, собранный один раз, строки без ORM (текущий user_service).
+
+Замеряется последовательное выполнение в одной AsyncSession, чтобы в цифрах была
+стоимость запроса и разбора результата, а не ожидание пула.
+Для логина дополнительно печатается план: ожидается Index Only Scan по users_username_auth_idx.
+
+Запуск (postgres из docker-compose проброшен на localhost:5432):
+    python bench/orm_vs_core.py --iterations 5000
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from sqlalchemy import Column, DateTime, Integer, String, bindparam, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import declarative_base
+
+DB_USER = os.getenv("DB_USER", "postgres")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "postgres")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "5432")
+DB_NAME = os.getenv("DB_NAME", "user_service")
+
+Base = declarative_base()
+
+
+class UserModel(Base):
+    __tablename__ = "users"
+
+    id = Column(Integer, primary_key=True)
+    username = Column(String)
+    password = Column(String(100))
+    first_name = Column(String)
+    last_name = Column(String)
+    email = Column(String)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+
+
+users = UserModel.__table__
+USER_COLUMNS = (users.c.id, users.c.username, users.c.first_name, users.c.last_name, users.c.email)
+USER_BY_ID_QUERY = select(*USER_COLUMNS).where(users.c.id == bindparam("user_id"))
+AUTH_BY_USERNAME_QUERY = select(users.c.id, users.c.username, users.c.password).where(
+    users.c.username == bindparam("username")
+)
+
+
+def user_to_dict(user):
+    return {
+        "id": user.id,
+        "username": user.username,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "email": user.email,
+    }
+
+
+async def orm_by_id(db, user_id, username):
+    user = (await db.execute(select(UserModel).where(UserModel.id == user_id))).scalars().first()
+    return user_to_dict(user)
+
+
+async def core_by_id(db, user_id, username):
+    return dict((await db.execute(USER_BY_ID_QUERY, {"user_id": user_id})).mappings().first())
+
+
+async def orm_login(db, user_id, username):
+    user = (await db.execute(select(UserModel).where(UserModel.username == username))).scalars().first()
+    return user.password
+
+
+async def core_login(db, user_id, username):
+    return (await db.execute(AUTH_BY_USERNAME_QUERY, {"username": username})).first().password
+
+
+async def measure(engine, lookup, users_sample, iterations):
+    async with AsyncSession(engine, expire_on_commit=False) as db:
+        for user_id, username in users_sample:
+            await lookup(db, user_id, username)
+        started = time.perf_counter()
+        for i in range(iterations):
+            user_id, username = users_sample[i % len(users_sample)]
+            await lookup(db, user_id, username)
+            # ORM держит загруженные объекты в identity map - сбрасываем, как в новом запросе
+            db.expunge_all()
+        return (time.perf_counter() - started) / iterations
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    engine = create_async_engine(f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
+    async with engine.connect() as conn:
+        users_sample = (await conn.execute(select(users.c.id, users.c.username).limit(100))).all()
+        plan = await conn.execute(
+            text("EXPLAIN SELECT id, username, password FROM users WHERE username = :username"),
+            {"username": users_sample[0].username},
+        )
+        print("login plan:", plan.scalars().first())
+
+    for name, orm, core in [("by id", orm_by_id, core_by_id), ("login", orm_login, core_login)]:
+        orm_time = await measure(engine, orm, users_sample, args.iterations)
+        core_time = await measure(engine, core, users_sample, args.iterations)
+        print(f"{name:6} orm={orm_time * 1e6:8.1f}us core={core_time * 1e6:8.1f}us x{orm_time / core_time:4.2f}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""Латентность GET /users/{id}, когда Redis зависает.
+
+Скрипт поднимает TCP-прокси перед настоящим Redis, который после --stall-after
+секунд перестаёт пересылать данные на --stall-for секунд (соединения остаются
+открытыми, как у зависшего Redis), и всё это время последовательно запрашивает
+случайных пользователей. Раз в секунду печатает p50/p99 и состояние breaker.
+
+Запуск: user-service должен ходить в Redis через прокси, например
+REDIS_URL=redis://host.docker.internal:6390/0, сам Redis - на localhost:6379:
+    python bench/redis_stall.py --username admin --password secret
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import urllib.error
+
+from common import USER_SERVICE_URL, get_token, request
+
+
+class StallingProxy:
+    def __init__(self, upstream_host, upstream_port):
+        self.upstream_host = upstream_host
+        self.upstream_port = upstream_port
+        self.stalled = False
+
+    async def pipe(self, reader, writer):
+        try:
+            while data := await reader.read(65536):
+                while self.stalled:
+                    await asyncio.sleep(0.05)
+                writer.write(data)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def handle(self, client_reader, client_writer):
+        upstream_reader, upstream_writer = await asyncio.open_connection(self.upstream_host, self.upstream_port)
+        await asyncio.gather(
+            self.pipe(client_reader, upstream_writer),
+            self.pipe(upstream_reader, client_writer),
+            return_exceptions=True,
+        )
+
+
+async def probe(token, max_user_id, seconds, proxy):
+    headers = {"Authorization": f"Bearer {token}"}
+    loop = asyncio.get_running_loop()
+    for second in range(seconds):
+        latencies = []
+        deadline = time.monotonic() + 1
+        while time.monotonic() < deadline:
+            url = f"{USER_SERVICE_URL}/users/{random.randint(1, max_user_id)}"
+            started = time.perf_counter()
+            try:
+                await loop.run_in_executor(None, request, url, None, headers)
+            except urllib.error.HTTPError:
+                pass
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        metrics = await loop.run_in_executor(None, request, USER_SERVICE_URL + "/metrics")
+        print(f"{second:>3}s {'stall' if proxy.stalled else 'ok':>5} "
+              f"p50={statistics.median(latencies) * 1000:7.2f}ms "
+              f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:7.2f}ms "
+              f"rps={len(latencies):5} breaker={metrics['cache_breaker_state']}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--listen-port", type=int, default=6390)
+    parser.add_argument("--redis-host", default="localhost")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    parser.add_argument("--max-user-id", type=int, default=100)
+    parser.add_argument("--stall-after", type=int, default=5)
+    parser.add_argument("--stall-for", type=int, default=15)
+    parser.add_argument("--duration", type=int, default=30)
+    args = parser.parse_args()
+
+    proxy = StallingProxy(args.redis_host, args.redis_port)
+    server = await asyncio.start_server(proxy.handle, "0.0.0.0", args.listen_port)
+    token = get_token(args.username, args.password)
+
+    async def stall():
+        await asyncio.sleep(args.stall_after)
+        proxy.stalled = True
+        await asyncio.sleep(args.stall_for)
+        proxy.stalled = False
+
+    stall_task = asyncio.create_task(stall())
+    await probe(token, args.max_user_id, args.duration, proxy)
+    stall_task.cancel()
+    server.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
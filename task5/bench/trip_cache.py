@@ -0,0 +1,59 @@
+"""wrk по GET /trips/{id} без кеша и с кешем поездок в Redis.
+
+Для каждой цели (--target имя=URL) создаёт поездку, запускает wrk с 1, 5 и 10
+потоками и печатает таблицы Average latency и Total requests в формате readme,
+а затем trip_cache_hit_ratio из /metrics каждой цели.
+
+Запуск (user-service на localhost:8001 выдаёт токен, wrk в PATH; trip-service
+с TRIP_CACHE_TTL=0 поднимается сервисом trip-service-nocache на порту 8013):
+    docker compose --profile bench up -d trip-service-nocache
+    python bench/trip_cache.py --username admin --password secret \\
+        --target "No Cache=http://localhost:8013" --target "With Cache=http://localhost:8002"
+"""
+import argparse
+import json
+
+from common import get_token, render_table, request, run_wrk
+
+TRIP = {
+    "route_id": 1,
+    "driver_id": 1,
+    "start_location": "Москва",
+    "end_location": "Тверь",
+    "departure_time": "2030-01-01T08:00:00",
+    "available_seats": 3,
+    "price": 500,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--target", action="append", required=True, help="имя=URL trip-service")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--connections", type=int, default=15)
+    parser.add_argument("--duration", type=int, default=10)
+    args = parser.parse_args()
+
+    token = get_token(args.username, args.password)
+    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {token}"}
+    targets = dict(target.split("=", 1) for target in args.target)
+    results = {}
+    for name, base_url in targets.items():
+        trip = request(base_url + "/trips/", json.dumps(TRIP).encode(), headers)
+        url = f"{base_url}/trips/{trip['id']}"
+        # прогрев: первое чтение кладёт поездку в кеш
+        run_wrk(token, url, 1, 1, 1)
+        results[name] = {count: run_wrk(token, url, count, args.connections, args.duration)
+                         for count in args.threads}
+        request(url, headers=headers, method="DELETE")
+
+    print("Average latency:\n\n" + render_table(results, 0, list(targets), args.threads))
+    print("\nTotal requests:\n\n" + render_table(results, 1, list(targets), args.threads))
+    for name, base_url in targets.items():
+        print(f"\n{name}: trip_cache_hit_ratio={request(base_url + '/metrics')['trip_cache_hit_ratio']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""План и стоимость запроса GET /trips/search.
+
+Заполняет отдельную коллекцию --trips поездками между --cities городами,
+создаёт те же индексы, что trip_service, и для первой и следующей страницы
+печатает стадии выигравшего плана, totalKeysExamined, totalDocsExamined и
+nReturned. Ожидается IXSCAN по trip_search_idx без стадии SORT, а
+docsExamined около limit + 1: занятые поездки отсекаются по ключам индекса.
+Для сравнения тот же запрос выполняется с одиночными индексами.
+
+Запуск (mongodb из docker-compose проброшен на localhost:27017):
+    python bench/trip_search_explain.py --trips 100000
+"""
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, IndexModel, MongoClient
+
+MONGO_HOST = os.getenv("MONGO_HOST", "localhost:27017")
+TRIP_SEARCH_INDEX = "trip_search_idx"
+
+
+def plan_stages(plan):
+    stages = [plan["stage"] + (f"({plan['indexName']})" if "indexName" in plan else "")]
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            stages += plan_stages(child)
+    return stages
+
+
+def explain(collection, query, limit, hint):
+    cursor = collection.find(query).sort([("departure_time", ASCENDING), ("_id", ASCENDING)]).limit(limit + 1)
+    if hint:
+        cursor = cursor.hint(hint)
+    stats = cursor.explain()["executionStats"]
+    return stats, plan_stages(stats["executionStages"])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trips", type=int, default=100000)
+    parser.add_argument("--cities", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    collection = MongoClient(host=[MONGO_HOST])["trip_service"]["trips_search_bench"]
+    collection.drop()
+    now = datetime.utcnow().replace(microsecond=0)
+    batch = []
+    for _ in range(args.trips):
+        seats = random.randint(1, 4)
+        joined = random.randint(0, seats)
+        batch.append({
+            "start_location": f"city-{random.randrange(args.cities)}",
+            "end_location": f"city-{random.randrange(args.cities)}",
+            "departure_time": now + timedelta(minutes=random.randrange(60 * 24 * 30)),
+            "available_seats": seats,
+            "user_ids": list(range(joined)),
+            "seats_left": seats - joined,
+        })
+        if len(batch) == 10000:
+            collection.insert_many(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch)
+
+    query = {
+        "start_location": "city-1",
+        "end_location": "city-2",
+        "departure_time": {"$gte": now + timedelta(days=1), "$lt": now + timedelta(days=2)},
+        "seats_left": {"$gte": 1},
+    }
+
+    collection.create_indexes([
+        IndexModel([("start_location", ASCENDING)]),
+        IndexModel([("end_location", ASCENDING)]),
+        IndexModel([("departure_time", ASCENDING)]),
+    ])
+    stats, stages = explain(collection, query, args.limit, None)
+    print(f"single  keys={stats['totalKeysExamined']:>6} docs={stats['totalDocsExamined']:>6} "
+          f"returned={stats['nReturned']:>3} {stats['executionTimeMillis']}ms {' <- '.join(stages)}")
+
+    collection.create_indexes([IndexModel([
+        ("start_location", ASCENDING),
+        ("end_location", ASCENDING),
+        ("departure_time", ASCENDING),
+        ("_id", ASCENDING),
+        ("seats_left", ASCENDING),
+    ], name=TRIP_SEARCH_INDEX)])
+    first = list(collection.find(query).sort([("departure_time", ASCENDING), ("_id", ASCENDING)]).limit(args.limit))
+    pages = [("page 1", query)]
+    if len(first) == args.limit:
+        last = first[-1]
+        page_query = dict(query, departure_time=dict(query["departure_time"], **{"$gte": last["departure_time"]}))
+        pages.append(("page 2", dict(page_query, **{"$or": [
+            {"departure_time": {"$gt": last["departure_time"]}},
+            {"departure_time": last["departure_time"], "_id": {"$gt": last["_id"]}},
+        ]})))
+    for name, page_query in pages:
+        stats, stages = explain(collection, page_query, args.limit, TRIP_SEARCH_INDEX)
+        print(f"{name}  keys={stats['totalKeysExamined']:>6} docs={stats['totalDocsExamined']:>6} "
+              f"returned={stats['nReturned']:>3} {stats['executionTimeMillis']}ms {' <- '.join(stages)}")
+        assert "SORT" not in stages and "COLLSCAN" not in stages, stages
+
+    collection.drop()
+
+
+if __name__ == "__main__":
+    main()
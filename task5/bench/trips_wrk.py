@@ -0,0 +1,59 @@
+"""wrk по trip-service при растущем числе соединений.
+
+Для каждой цели (--target имя=URL) и каждого числа соединений запускает wrk
+на GET /trips/{id} и печатает таблицу Requests/sec в формате readme.
+Синхронный MongoClient в def-обработчиках упирается в threadpool Starlette
+(~40 потоков), поэтому его RPS перестаёт расти после ~40 соединений;
+motor должен масштабироваться дальше, пока не упрётся в MONGO_POOL_SIZE и Mongo.
+
+Запуск (user-service на localhost:8001 выдаёт токен, wrk в PATH; старая
+синхронная версия trip_service поднимается сервисом trip-service-sync на порту 8012):
+    git show 768da69^:task5/trip_service/main.py > trip_service/main_sync.py
+    docker compose --profile bench up -d trip-service-sync
+    python bench/trips_wrk.py --username admin --password secret \\
+        --target sync=http://localhost:8012 --target async=http://localhost:8002
+"""
+import argparse
+import json
+
+from common import get_token, render_table, request, run_wrk
+
+TRIP = {
+    "route_id": 1,
+    "driver_id": 1,
+    "start_location": "Москва",
+    "end_location": "Тверь",
+    "departure_time": "2030-01-01T08:00:00",
+    "available_seats": 3,
+    "price": 500,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--target", action="append", required=True, help="имя=URL trip-service")
+    parser.add_argument("--connections", type=int, nargs="+", default=[10, 50, 100, 200, 400])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--duration", type=int, default=10)
+    args = parser.parse_args()
+
+    token = get_token(args.username, args.password)
+    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {token}"}
+    targets = dict(target.split("=", 1) for target in args.target)
+    results = {}
+    for name, base_url in targets.items():
+        trip = request(base_url + "/trips/", json.dumps(TRIP).encode(), headers)
+        url = f"{base_url}/trips/{trip['id']}"
+        # прогрев пула соединений
+        run_wrk(token, url, 1, 1, 1)
+        results[name] = {count: run_wrk(token, url, min(args.threads, count), count, args.duration)
+                         for count in args.connections}
+        request(url, headers=headers, method="DELETE")
+
+    print(render_table(results, 2, list(targets), args.connections, title="Connections", digits=0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+#!/bin/bash
+# разрешает потоковую репликацию для postgres-replica из docker-compose
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -11,6 +11,7 @@ if (db.trips.countDocuments({}) === 0) {
             end_location: "Санкт-Петербург, Невский проспект",
             departure_time: ISODate("2024-03-27T08:00:00Z"),
             available_seats: 3,
+            seats_left: 2,
             price: 1500.00,
             description: "Комфортабельный минивэн"
         },
@@ -22,14 +23,20 @@ if (db.trips.countDocuments({}) === 0) {
             end_location: "Великий Новгород, Кремль",
             departure_time: ISODate("2024-03-28T09:00:00Z"),
             available_seats: 4,
+            seats_left: 3,
             price: 800.00,
             description: "Эконом-класс"
         }
     ]);
     
     print("Created indexes...");
-    db.trips.createIndex({ driver_id: 1 });
-    db.trips.createIndex({ start_location: 1 });
+    db.trips.createIndex({ driver_id: 1, departure_time: 1, _id: 1 }, { name: "trip_driver_idx" });
+    db.trips.createIndex({ user_ids: 1, departure_time: 1, _id: 1 }, { name: "trip_passenger_idx" });
+    db.trips.createIndex({ route_id: 1, departure_time: 1, _id: 1 }, { name: "trip_route_idx" });
+    db.trips.createIndex(
+        { start_location: 1, end_location: 1, departure_time: 1, _id: 1, seats_left: 1 },
+        { name: "trip_search_idx" }
+    );
     db.trips.createIndex({ end_location: 1 });
     db.trips.createIndex({ departure_time: 1 });
     db.trips.createIndex({ id: 1 });
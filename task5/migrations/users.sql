@@ -9,7 +9,15 @@ create table users (
 	updated_at DATE
 );
 
-create index users_username_idx on "users" ("username");
+-- покрывающий индекс: логин читает id и password без обращения к таблице
+create index users_username_auth_idx on "users" ("username") include ("id", "password");
+
+create extension if not exists pg_trgm;
+create index users_first_name_trgm_idx on "users" using gin ("first_name" gin_trgm_ops);
+create index users_last_name_trgm_idx on "users" using gin ("last_name" gin_trgm_ops);
+-- маски короче 3 символов ищутся по префиксу: триграмм в них нет
+create index users_first_name_prefix_idx on "users" ((lower("first_name") collate "C"), "id");
+create index users_last_name_prefix_idx on "users" ((lower("last_name") collate "C"), "id");
 
 insert into users (id, username, password, first_name, last_name, email, created_at, updated_at) values (1, 'nantognazzi0', '$2a$04$.zvo.EB6JvsVyJdDV8N.muq/5c.nS2gIJoMw4y4LRo6yd7R8rGtgO', 'Nadean', 'Antognazzi', 'nantognazzi0@tripadvisor.com', '11/22/2024', '5/5/2024');
 insert into users (id, username, password, first_name, last_name, email, created_at, updated_at) values (2, 'tgarbett1', '$2a$04$09KCw2rCIr.AGwzJhp6NQ.wIjCM.UNB8xw9etuUWv5ebhYYZGSW7C', 'Thibaut', 'Garbett', 'tgarbett1@themeforest.net', '10/2/2024', '4/2/2025');
@@ -111,4 +119,45 @@ insert into users (id, username, password, first_name, last_name, email, created
 insert into users (id, username, password, first_name, last_name, email, created_at, updated_at) values (98, 'dblaschek2p', '$2a$04$wrOF4IUxFsE5YQaIqiLpe.yfdHMhQwS5sFh4kXoEQJJWo3MN0WriC', 'Donny', 'Blaschek', 'dblaschek2p@phoca.cz', '1/30/2025', '12/26/2024');
 insert into users (id, username, password, first_name, last_name, email, created_at, updated_at) values (99, 'aperes2q', '$2a$04$bOTOKQFtZ7wAVO0klEio7.tXiXjoL14gh5tvldP6CodKv1SgrT3u2', 'Ashby', 'Peres', 'aperes2q@huffingtonpost.com', '4/8/2025', '7/16/2024');
 insert into users (id, username, password, first_name, last_name, email, created_at, updated_at) values (100, 'aleverett2r', '$2a$04$TX.462duirqjP4RWxZq0r.KyZmFitzIMffacp4P3H0ide4GsqpWJm', 'Audrey', 'Leverett', 'aleverett2r@networkadvertising.org', '11/27/2024', '5/10/2024');
-insert into users (id, username, password, first_name, last_name, email, created_at, updated_at) values (101, 'admin', '$2b$12$LFGxmIvXMLHwsPScIR4jguvqPeZrKbOEJDDAvruhIqUKFW0ZF3X0u', 'Admin', 'User', 'admin@example.com', '11/27/2024', '5/10/2024'); 
\ No newline at end of file
+insert into users (id, username, password, first_name, last_name, email, created_at, updated_at) values (101, 'admin', '$2b$12$LFGxmIvXMLHwsPScIR4jguvqPeZrKbOEJDDAvruhIqUKFW0ZF3X0u', 'Admin', 'User', 'admin@example.com', '11/27/2024', '5/10/2024'); 
+
+-- уведомления для инвалидации кеша user_service при изменениях мимо сервиса
+create or replace function notify_users_changed() returns trigger as $$
+declare
+    changed jsonb;
+    chunk jsonb;
+begin
+    -- собственные записи сервиса уже отражены в кеше через CacheStrategy
+    if current_setting('application_name') = 'user_service' then
+        return null;
+    end if;
+    if TG_OP = 'INSERT' then
+        select jsonb_agg(jsonb_build_array(id, username)) into changed from new_rows;
+    elsif TG_OP = 'DELETE' then
+        select jsonb_agg(jsonb_build_array(id, username)) into changed from old_rows;
+    else
+        select jsonb_agg(jsonb_build_array(id, username)) into changed
+        from (select id, username from old_rows union select id, username from new_rows) as rows;
+    end if;
+    -- payload NOTIFY ограничен 8000 байт
+    for chunk in
+        select jsonb_agg(value) from jsonb_array_elements(coalesce(changed, '[]')) with ordinality
+        group by (ordinality - 1) / 50
+    loop
+        perform pg_notify('users_changed', chunk::text);
+    end loop;
+    return null;
+end;
+$$ language plpgsql;
+
+create or replace trigger users_notify_insert after insert on users
+referencing new table as new_rows
+for each statement execute function notify_users_changed();
+
+create or replace trigger users_notify_update after update on users
+referencing old table as old_rows new table as new_rows
+for each statement execute function notify_users_changed();
+
+create or replace trigger users_notify_delete after delete on users
+referencing old table as old_rows
+for each statement execute function notify_users_changed();
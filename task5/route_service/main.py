@@ -3,6 +3,7 @@ from typing import List, Optional
 from fastapi import FastAPI, Depends, HTTPException, status
 from pydantic import BaseModel, Field
 import jwt
+from fastapi.responses import ORJSONResponse
 from fastapi.security import OAuth2PasswordBearer
 import os
 
@@ -15,7 +16,8 @@ routes_db = {}
 
 app = FastAPI(title="Route Service", 
               description="Сервис управления маршрутами", 
-              version="1.0.0")
+              version="1.0.0",
+              default_response_class=ORJSONResponse)
 
 users_db = {}
 
@@ -1,35 +1,137 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, status
+from fastapi.responses import ORJSONResponse, Response
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel, Field
 from typing import List, Optional
 import jwt
-from datetime import datetime
+from datetime import datetime, timezone
 import os
-from pymongo import MongoClient, IndexModel, ASCENDING
+import base64
+import random
+import orjson
+from collections import defaultdict
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel, ASCENDING, ReturnDocument
 from bson import ObjectId
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
 
 
 
 DB_HOST = os.getenv("MONGO_HOST")
-client = MongoClient(host=[DB_HOST])
+# пул соединений motor: запросы ждут свободное соединение не дольше MONGO_POOL_TIMEOUT секунд
+MONGO_POOL_SIZE = int(os.getenv("MONGO_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "10"))
+MONGO_POOL_TIMEOUT = float(os.getenv("MONGO_POOL_TIMEOUT", "5"))
+MONGO_TIMEOUT = float(os.getenv("MONGO_TIMEOUT", "5"))
+
+TRIP_SEARCH_LIMIT = int(os.getenv("TRIP_SEARCH_LIMIT", "20"))
+TRIP_SEARCH_MAX_LIMIT = 100
+# поиск: равенство по маршруту, диапазон по времени, сортировка по (departure_time, _id)
+# для курсора, seats_left проверяется по ключам индекса без чтения документов
+TRIP_SEARCH_INDEX = "trip_search_idx"
+# списки поездок водителя, пассажира (multikey по user_ids) и маршрута в порядке отправления
+TRIP_LIST_LIMIT = int(os.getenv("TRIP_LIST_LIMIT", "50"))
+TRIP_LIST_MAX_LIMIT = 200
+TRIP_DRIVER_INDEX = "trip_driver_idx"
+TRIP_PASSENGER_INDEX = "trip_passenger_idx"
+TRIP_ROUTE_INDEX = "trip_route_idx"
+# в списках не отдаём user_ids и description, которые могут быть длинными
+TRIP_SUMMARY_PROJECTION = {
+    "route_id": 1,
+    "driver_id": 1,
+    "start_location": 1,
+    "end_location": 1,
+    "departure_time": 1,
+    "available_seats": 1,
+    "seats_left": 1,
+    "price": 1,
+}
+
+client = AsyncIOMotorClient(
+    host=[DB_HOST],
+    maxPoolSize=MONGO_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    waitQueueTimeoutMS=int(MONGO_POOL_TIMEOUT * 1000),
+    serverSelectionTimeoutMS=int(MONGO_TIMEOUT * 1000),
+    connectTimeoutMS=int(MONGO_TIMEOUT * 1000),
+)
 db = client['trip_service']
 collection = db['trips']
 
-collection.create_indexes([
-    IndexModel([("driver_id", ASCENDING)]),
-    IndexModel([("start_location", ASCENDING)]),
-    IndexModel([("end_location", ASCENDING)]),
-    IndexModel([("departure_time", ASCENDING)])
-])
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/1")
+REDIS_POOL_SIZE = int(os.getenv("REDIS_POOL_SIZE", "50"))
+REDIS_TIMEOUT = float(os.getenv("REDIS_TIMEOUT", "0.1"))
+# ожидание свободного соединения; при исчерпанном пуле быстрее прочитать поездку из Mongo
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "0.2"))
+# 0 - кеш поездок выключен
+TRIP_CACHE_TTL = int(os.getenv("TRIP_CACHE_TTL", "600"))
+# разброс TTL, чтобы ключи, записанные вместе, не истекали одновременно
+CACHE_TTL_JITTER = float(os.getenv("CACHE_TTL_JITTER", "0.1"))
+
+redis_pool = aioredis.BlockingConnectionPool.from_url(
+    REDIS_URL,
+    max_connections=REDIS_POOL_SIZE,
+    timeout=REDIS_POOL_TIMEOUT,
+    socket_timeout=REDIS_TIMEOUT,
+    socket_connect_timeout=REDIS_TIMEOUT,
+)
+redis_client = aioredis.Redis(connection_pool=redis_pool)
+
+# trip:<id> - хеш {body, version}; version = len(user_ids) только растёт, поэтому
+# запоздавшая запись (чтение или join, обогнанные другим join) не затирает более свежую
+TRIP_CACHE_SET_SCRIPT = """
+local version = redis.call('hget', KEYS[1], 'version')
+if version and tonumber(version) > tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('hset', KEYS[1], 'body', ARGV[1], 'version', ARGV[2])
+redis.call('expire', KEYS[1], ARGV[3])
+return 1
+"""
+# удалённая поездка остаётся в кеше пустой записью с версией, которую не перебить
+TRIP_DELETED_VERSION = 2 ** 53
+
+metrics = defaultdict(float)
 
 
 app = FastAPI(
     title="Trip Service",
     description="Сервис управления поездками",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 
+@app.on_event("startup")
+async def startup():
+    await collection.create_indexes([
+        IndexModel([("end_location", ASCENDING)]),
+        IndexModel([("departure_time", ASCENDING)]),
+        IndexModel([
+            ("start_location", ASCENDING),
+            ("end_location", ASCENDING),
+            ("departure_time", ASCENDING),
+            ("_id", ASCENDING),
+            ("seats_left", ASCENDING),
+        ], name=TRIP_SEARCH_INDEX),
+        IndexModel([("driver_id", ASCENDING), ("departure_time", ASCENDING), ("_id", ASCENDING)],
+                   name=TRIP_DRIVER_INDEX),
+        IndexModel([("user_ids", ASCENDING), ("departure_time", ASCENDING), ("_id", ASCENDING)],
+                   name=TRIP_PASSENGER_INDEX),
+        IndexModel([("route_id", ASCENDING), ("departure_time", ASCENDING), ("_id", ASCENDING)],
+                   name=TRIP_ROUTE_INDEX),
+    ])
+    # поездки, созданные до появления seats_left
+    await collection.update_many({"seats_left": {"$exists": False}}, [SET_SEATS_LEFT])
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    client.close()
+    await redis_pool.disconnect()
+
+
 class TripBase(BaseModel):
     route_id: int
     driver_id: int = Field(..., gt=0)
@@ -44,6 +146,29 @@ class TripBase(BaseModel):
 
 class TripResponse(TripBase):
     id: str
+    seats_left: int
+
+
+class TripPage(BaseModel):
+    items: List[TripResponse]
+    next_cursor: Optional[str] = None
+
+
+class TripSummary(BaseModel):
+    id: str
+    route_id: int
+    driver_id: int
+    start_location: str
+    end_location: str
+    departure_time: datetime
+    available_seats: int
+    seats_left: int
+    price: float
+
+
+class TripSummaryPage(BaseModel):
+    items: List[TripSummary]
+    next_cursor: Optional[str] = None
 
 
 class JoinRequest(BaseModel):
@@ -55,7 +180,7 @@ ALGORITHM = os.getenv('ALGORITHM', "HS256")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="http://user-service:8001/token")
 
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -71,42 +196,211 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
         raise credentials_exception
 
 
+SET_SEATS_LEFT = {"$set": {"seats_left": {"$subtract": ["$available_seats", {"$size": "$user_ids"}]}}}
+
+
+def join_update(user_id: int):
+    can_join = {"$and": [
+        {"$not": [{"$in": [user_id, "$user_ids"]}]},
+        {"$lt": [{"$size": "$user_ids"}, "$available_seats"]},
+    ]}
+    return [
+        {"$set": {"user_ids": {
+            "$cond": [can_join, {"$concatArrays": ["$user_ids", [user_id]]}, "$user_ids"]
+        }}},
+        SET_SEATS_LEFT,
+    ]
+
+
+def to_utc(value: datetime) -> datetime:
+    # Mongo хранит время в UTC без зоны, в таком же виде его возвращает курсор
+    if value.tzinfo:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def encode_cursor(trip: dict) -> str:
+    raw = f"{trip['departure_time'].isoformat()}|{trip['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        departure_time, trip_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(departure_time), ObjectId(trip_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def jittered(ttl: int):
+    # поездки, прогретые одной волной чтений, не уходят в Mongo все в одну секунду
+    return max(1, int(ttl * random.uniform(1 - CACHE_TTL_JITTER, 1 + CACHE_TTL_JITTER)))
+
+
+def json_response(raw: bytes):
+    # raw - сериализованный TripResponse из Redis или cache_trip, отдаётся без повторной сборки модели
+    return Response(content=raw, media_type="application/json")
+
+
+def trip_cache_key(trip_id: ObjectId) -> str:
+    return f"trip:{trip_id}"
+
+
+async def read_cached_trip(trip_id: ObjectId) -> Optional[bytes]:
+    if not TRIP_CACHE_TTL:
+        return None
+    try:
+        raw = await redis_client.hget(trip_cache_key(trip_id), "body")
+    except RedisError:
+        metrics["trip_cache_errors"] += 1
+        return None
+    if raw:
+        metrics["trip_cache_hits"] += 1
+        return raw
+    metrics["trip_cache_misses"] += 1
+    return None
+
+
+async def write_cached_trip(trip_id: ObjectId, body: bytes, version: int):
+    if not TRIP_CACHE_TTL:
+        return
+    try:
+        written = await redis_client.eval(
+            TRIP_CACHE_SET_SCRIPT, 1, trip_cache_key(trip_id), body, version, jittered(TRIP_CACHE_TTL)
+        )
+        metrics["trip_cache_writes" if written else "trip_cache_stale_writes"] += 1
+    except RedisError:
+        metrics["trip_cache_errors"] += 1
+
+
+async def cache_trip(trip: dict) -> bytes:
+    trip["id"] = str(trip["_id"])
+    body = orjson.dumps(TripResponse(**trip).dict())
+    await write_cached_trip(trip["_id"], body, len(trip["user_ids"]))
+    return body
+
+
+async def find_page(query: dict, index: str, limit: int, cursor: Optional[str], projection: Optional[dict] = None):
+    if cursor:
+        after_time, after_id = decode_cursor(cursor)
+        # нижняя граница по времени сужает диапазон индекса, $or лишь отсекает совпадения по времени
+        departure_time = query.setdefault("departure_time", {})
+        departure_time["$gte"] = max(departure_time.get("$gte", after_time), after_time)
+        query["$or"] = [
+            {"departure_time": {"$gt": after_time}},
+            {"departure_time": after_time, "_id": {"$gt": after_id}},
+        ]
+
+    # запрашиваем на одну поездку больше, чтобы знать, есть ли следующая страница
+    trips = await collection.find(query, projection).sort(
+        [("departure_time", ASCENDING), ("_id", ASCENDING)]
+    ).hint(index).limit(limit + 1).to_list(length=limit + 1)
+    next_cursor = encode_cursor(trips[limit - 1]) if len(trips) > limit else None
+    trips = trips[:limit]
+    for trip in trips:
+        trip["id"] = str(trip["_id"])
+    return {"items": trips, "next_cursor": next_cursor}
+
+
 @app.post("/trips/", response_model=TripResponse, status_code=status.HTTP_201_CREATED)
-def create_trip(trip: TripBase, current_user: str = Depends(get_current_user)):
+async def create_trip(trip: TripBase, current_user: str = Depends(get_current_user)):
     trip_dict = trip.dict()
-    result = collection.insert_one(trip_dict)
+    trip_dict["seats_left"] = trip.available_seats - len(trip.user_ids)
+    result = await collection.insert_one(trip_dict)
     trip_dict["id"] = str(result.inserted_id)
     return trip_dict
 
 
 @app.get("/trips/", response_model=List[TripResponse])
-def get_all_trips(current_user: str = Depends(get_current_user)):
+async def get_all_trips(current_user: str = Depends(get_current_user)):
     trips = []
-    for trip in collection.find():
+    async for trip in collection.find():
         trip["id"] = str(trip["_id"])
         trips.append(trip)
     return trips
 
 
+@app.get("/trips/search", response_model=TripPage)
+async def search_trips(
+    start_location: str = Query(..., min_length=1),
+    end_location: str = Query(..., min_length=1),
+    departure_from: Optional[datetime] = None,
+    departure_to: Optional[datetime] = None,
+    min_seats: int = Query(1, ge=1),
+    limit: int = Query(TRIP_SEARCH_LIMIT, ge=1, le=TRIP_SEARCH_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    current_user: str = Depends(get_current_user)
+):
+    departure_time = {"$gte": to_utc(departure_from) if departure_from else datetime.utcnow()}
+    if departure_to:
+        departure_time["$lt"] = departure_to
+    query = {
+        "start_location": start_location,
+        "end_location": end_location,
+        "departure_time": departure_time,
+        "seats_left": {"$gte": min_seats},
+    }
+    return await find_page(query, TRIP_SEARCH_INDEX, limit, cursor)
+
+
+@app.get("/trips/driver/{driver_id}", response_model=TripSummaryPage)
+async def get_driver_trips(
+    driver_id: int,
+    limit: int = Query(TRIP_LIST_LIMIT, ge=1, le=TRIP_LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    current_user: str = Depends(get_current_user)
+):
+    return await find_page({"driver_id": driver_id}, TRIP_DRIVER_INDEX, limit, cursor, TRIP_SUMMARY_PROJECTION)
+
+
+@app.get("/trips/passenger/{user_id}", response_model=TripSummaryPage)
+async def get_passenger_trips(
+    user_id: int,
+    limit: int = Query(TRIP_LIST_LIMIT, ge=1, le=TRIP_LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    current_user: str = Depends(get_current_user)
+):
+    return await find_page({"user_ids": user_id}, TRIP_PASSENGER_INDEX, limit, cursor, TRIP_SUMMARY_PROJECTION)
+
+
+@app.get("/trips/route/{route_id}", response_model=TripSummaryPage)
+async def get_route_trips(
+    route_id: int,
+    limit: int = Query(TRIP_LIST_LIMIT, ge=1, le=TRIP_LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    current_user: str = Depends(get_current_user)
+):
+    return await find_page({"route_id": route_id}, TRIP_ROUTE_INDEX, limit, cursor, TRIP_SUMMARY_PROJECTION)
+
+
 @app.get("/trips/{trip_id}", response_model=TripResponse)
-def get_trip(trip_id: str, current_user: str = Depends(get_current_user)):
+async def get_trip(trip_id: str, current_user: str = Depends(get_current_user)):
     if not ObjectId.is_valid(trip_id):
         raise HTTPException(status_code=400, detail="Invalid trip ID")
     
-    trip = collection.find_one({"_id": ObjectId(trip_id)})
+    raw = await read_cached_trip(ObjectId(trip_id))
+    if raw:
+        return json_response(raw)
+
+    trip = await collection.find_one({"_id": ObjectId(trip_id)})
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
     
-    trip["id"] = str(trip["_id"])
-    return trip
+    return json_response(await cache_trip(trip))
 
 
 @app.patch("/trips/{trip_id}/join", response_model=TripResponse)
-def join_trip(trip_id: str, request: JoinRequest, current_user: str = Depends(get_current_user)):
+async def join_trip(trip_id: str, request: JoinRequest, current_user: str = Depends(get_current_user)):
     if not ObjectId.is_valid(trip_id):
         raise HTTPException(status_code=400, detail="Invalid trip ID")
     
-    trip = collection.find_one({"_id": ObjectId(trip_id)})
+    # один атомарный запрос: пассажир добавляется, только если его ещё нет и места остались;
+    # возвращается документ до изменения, по нему определяется причина отказа
+    trip = await collection.find_one_and_update(
+        {"_id": ObjectId(trip_id)},
+        join_update(request.user_id),
+        return_document=ReturnDocument.BEFORE,
+    )
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
     
@@ -116,22 +410,27 @@ def join_trip(trip_id: str, request: JoinRequest, current_user: str = Depends(ge
     if len(trip["user_ids"]) >= trip["available_seats"]:
         raise HTTPException(status_code=400, detail="No available seats")
     
-    collection.update_one(
-        {"_id": ObjectId(trip_id)},
-        {"$push": {"user_ids": request.user_id}}
-    )
-    
-    updated_trip = collection.find_one({"_id": ObjectId(trip_id)})
-    updated_trip["id"] = str(updated_trip["_id"])
-    return updated_trip
+    trip["user_ids"].append(request.user_id)
+    trip["seats_left"] = trip["available_seats"] - len(trip["user_ids"])
+    return json_response(await cache_trip(trip))
 
 
 @app.delete("/trips/{trip_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_trip(trip_id: str, current_user: str = Depends(get_current_user)):
+async def delete_trip(trip_id: str, current_user: str = Depends(get_current_user)):
     if not ObjectId.is_valid(trip_id):
         raise HTTPException(status_code=400, detail="Invalid trip ID")
     
-    result = collection.delete_one({"_id": ObjectId(trip_id)})
+    result = await collection.delete_one({"_id": ObjectId(trip_id)})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Trip not found")
+    await write_cached_trip(ObjectId(trip_id), b"", TRIP_DELETED_VERSION)
     return None
+
+
+@app.get("/metrics")
+async def read_metrics():
+    lookups = metrics["trip_cache_hits"] + metrics["trip_cache_misses"]
+    return {
+        **metrics,
+        "trip_cache_hit_ratio": metrics["trip_cache_hits"] / lookups if lookups else 0.0,
+    }
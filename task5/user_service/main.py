@@ -1,43 +1,297 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, status
+from fastapi.responses import ORJSONResponse, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Literal, Optional
 import jwt
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
 import os
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, func
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
-import redis
+from sqlalchemy import Column, Integer, String, DateTime, func, select, literal, case, text, bindparam, union_all
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base
+import redis.asyncio as aioredis
+from redis.exceptions import ConnectionError as RedisConnectionError, RedisError
+import asyncpg
 import json 
+import orjson
+import msgpack
+import zlib
+import csv
+import io
+import asyncio
+import contextvars
+import math
+import random
+import multiprocessing
+import time
+import uuid
+from collections import Counter, defaultdict, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from passwords import hash_password_job, hash_passwords_job, verify_password_job
 
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+# реплики для чтения: SQLAlchemy URL через запятую
+DB_REPLICA_URLS = [url.strip() for url in os.getenv("DB_REPLICA_URLS", "").split(",") if url.strip()]
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "1"))
+DB_REPLICA_MAX_LAG_BYTES = int(os.getenv("DB_REPLICA_MAX_LAG_BYTES", str(16 * 1024 * 1024)))
+# сколько секунд живёт отметка позиции WAL после записи; реплика догоняет её за миллисекунды
+DB_REPLICA_FENCE_TTL = int(os.getenv("DB_REPLICA_FENCE_TTL", "60"))
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
-redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+REDIS_POOL_SIZE = int(os.getenv("REDIS_POOL_SIZE", "50"))
+REDIS_TIMEOUT = float(os.getenv("REDIS_TIMEOUT", "0.1"))
+# ожидание свободного соединения в пуле: очередь под нагрузкой - не отказ Redis
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "1"))
+# после CACHE_BREAKER_FAILURES ошибок Redis подряд кеш обходится CACHE_BREAKER_RESET секунд
+CACHE_BREAKER_FAILURES = int(os.getenv("CACHE_BREAKER_FAILURES", "5"))
+CACHE_BREAKER_RESET = float(os.getenv("CACHE_BREAKER_RESET", "5"))
 
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+redis_pool = aioredis.BlockingConnectionPool.from_url(
+    REDIS_URL,
+    max_connections=REDIS_POOL_SIZE,
+    timeout=REDIS_POOL_TIMEOUT,
+    socket_timeout=REDIS_TIMEOUT,
+    socket_connect_timeout=REDIS_TIMEOUT,
+)
+redis_client = aioredis.Redis(connection_pool=redis_pool)
+# pub/sub держит соединение постоянно, поэтому у него свой клиент без socket_timeout
+redis_pubsub_client = aioredis.from_url(REDIS_URL, socket_connect_timeout=REDIS_TIMEOUT, decode_responses=True)
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "3600"))
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "600"))
+# разброс TTL, чтобы ключи, записанные вместе, не истекали одновременно
+CACHE_TTL_JITTER = float(os.getenv("CACHE_TTL_JITTER", "0.1"))
+
+# json - значение лежит в Redis готовым телом ответа,
+# msgpack - компактнее: массив значений без имён полей
+CACHE_ENCODING = os.getenv("CACHE_ENCODING", "json")
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", "1024"))
+USER_FIELDS = ("id", "username", "first_name", "last_name", "email")
+
+# режим работы кеша, переключается и на лету через PUT /admin/cache-mode
+CACHE_MODES = ("off", "read-through", "write-through", "write-behind")
+CACHE_MODE = os.getenv("CACHE_MODE", "write-through")
+if CACHE_MODE not in CACHE_MODES:
+    raise ValueError(f"CACHE_MODE must be one of {', '.join(CACHE_MODES)}")
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "0.05"))
+WRITE_BEHIND_BATCH = int(os.getenv("WRITE_BEHIND_BATCH", "500"))
+# сверх этого (или при разомкнутом breaker) очередь write-behind сбрасывается в dirty-ключи
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+# режим кеша через /admin/* могут менять только эти пользователи
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
+
+CACHE_INVALIDATION_CHANNEL = "cache:invalidate"
+# режим из PUT /admin/cache-mode, его читают воркеры при старте и переподписке
+CACHE_MODE_KEY = "cache:mode"
+WORKER_ID = uuid.uuid4().hex
+
+NEGATIVE_CACHE_TTL = int(os.getenv("NEGATIVE_CACHE_TTL", "60"))
+# отметка "пользователя нет" в Redis и её представление в L1
+TOMBSTONE = b"!missing"
+MISSING = object()
+
+CACHE_LOCK_TTL_MS = int(os.getenv("CACHE_LOCK_TTL_MS", "2000"))
+CACHE_LOCK_WAIT = float(os.getenv("CACHE_LOCK_WAIT", "0.1"))
+CACHE_EARLY_REFRESH_BETA = float(os.getenv("CACHE_EARLY_REFRESH_BETA", "1.0"))
+# cache:ver:{key} растёт при каждой записи ключа и должен жить дольше любой загрузки из БД
+CACHE_VERSION_TTL = int(os.getenv("CACHE_VERSION_TTL", "300"))
+
+USERS_CHANGED_CHANNEL = "users_changed"
+DB_NOTIFY_CHECK_INTERVAL = float(os.getenv("DB_NOTIFY_CHECK_INTERVAL", "10"))
+
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# загрузчик кладёт значение, только если версия ключа не изменилась с начала загрузки:
+# иначе прочитанная до записи строка затёрла бы новое значение или отметку отсутствия.
+# KEYS - пары (ключ, его ключ версии), ARGV - тройки (версия до загрузки, значение, TTL)
+CACHE_SET_IF_UNCHANGED_SCRIPT = """
+local stored = {}
+for i = 1, #KEYS, 2 do
+    local n = (i - 1) / 2 * 3
+    if (redis.call('get', KEYS[i + 1]) or '') == ARGV[n + 1] then
+        redis.call('set', KEYS[i], ARGV[n + 2], 'EX', ARGV[n + 3])
+        stored[#stored + 1] = 1
+    else
+        stored[#stored + 1] = 0
+    end
+end
+return stored
+"""
+
+DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# по application_name триггер на users отличает записи самого сервиса
+DB_APPLICATION_NAME = "user_service"
+
+engine = create_async_engine(
+    DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_pre_ping=True,
+    connect_args={"server_settings": {"application_name": DB_APPLICATION_NAME}},
+)
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+WAL_LSN_SQL = text("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), '0/0')::bigint")
+REPLICA_STATUS_SQL = text("""
+    SELECT pg_wal_lsn_diff(
+        CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_lsn() END, '0/0'
+    )::bigint
+""")
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        self.engine = create_async_engine(
+            url,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_pre_ping=True,
+            # недоступная реплика не должна задерживать проверку остальных
+            connect_args={"timeout": DB_POOL_TIMEOUT, "server_settings": {"application_name": DB_APPLICATION_NAME}},
+        )
+        self.session = async_sessionmaker(self.engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+        self.healthy = False
+        self.replay_lsn = 0
+
+
+replicas = [Replica(url) for url in DB_REPLICA_URLS]
+# позиция WAL после записей клиента (db:fence:user:{id}) и после любой записи
+# (db:fence:writes); реплика подходит для чтения, только если уже проиграла её
+USER_FENCE_KEY = "db:fence:user:{}"
+WRITES_FENCE_KEY = "db:fence:writes"
+FENCE_MAX_SCRIPT = """
+local current = tonumber(redis.call('get', KEYS[1]) or '0')
+if tonumber(ARGV[1]) > current then
+    redis.call('set', KEYS[1], ARGV[1], 'EX', ARGV[2])
+end
+return 1
+"""
+# id пользователя из токена текущего запроса; загрузчики кеша наследуют его вместе с контекстом задачи
+current_user_id = contextvars.ContextVar("current_user_id", default=None)
 Base = declarative_base()
 
 SECRET_KEY = os.getenv('SECRET_KEY', "your-secret-key")
 ALGORITHM = os.getenv('ALGORITHM', "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "32"))
+
+hash_executor = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+hash_in_flight = 0
+# у импорта свой пул по числу CPU: /token и POST /users/ не стоят в очереди за его пачками
+BULK_HASH_WORKERS = int(os.getenv("BULK_HASH_WORKERS", str(os.cpu_count() or 1)))
+bulk_hash_executor = ProcessPoolExecutor(max_workers=BULK_HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+NAME_SEARCH_LIMIT = int(os.getenv("NAME_SEARCH_LIMIT", "20"))
+NAME_SEARCH_MAX_LIMIT = 100
+# из маски короче триграммы pg_trgm не извлекает ни одного ключа GIN-индекса
+NAME_SEARCH_MIN_TRGM = 3
+
+BATCH_GET_MAX_IDS = int(os.getenv("BATCH_GET_MAX_IDS", "100"))
+BATCH_POST_MAX_IDS = int(os.getenv("BATCH_POST_MAX_IDS", "1000"))
+
+# bcrypt ~0.2 с на пароль и ядро: 1000 строк на 4 ядрах - около минуты синхронного запроса
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", "1000"))
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "1000"))
+BULK_HASH_CHUNK = int(os.getenv("BULK_HASH_CHUNK", "16"))
+BULK_COPY_COLUMNS = ["username", "password", "first_name", "last_name", "email", "created_at", "updated_at"]
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+
+LOCAL_CACHE_SIZE = int(os.getenv("LOCAL_CACHE_SIZE", "100000"))
+LOCAL_CACHE_MAX_BYTES = int(os.getenv("LOCAL_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+LOCAL_CACHE_TTL = float(os.getenv("LOCAL_CACHE_TTL", "30"))
+
+# частота обращений к пользователям копится в users:hot, по ней прогревается кеш
+HOT_USERS_KEY = "users:hot"
+HOT_USERS_TRACKED = int(os.getenv("HOT_USERS_TRACKED", "100000"))
+HOT_FLUSH_INTERVAL = float(os.getenv("HOT_FLUSH_INTERVAL", "5"))
+HOT_DECAY_INTERVAL = float(os.getenv("HOT_DECAY_INTERVAL", "3600"))
+WARMUP_USERS = int(os.getenv("WARMUP_USERS", "10000"))
+WARMUP_BATCH = int(os.getenv("WARMUP_BATCH", "1000"))
+REFRESH_AHEAD_INTERVAL = float(os.getenv("REFRESH_AHEAD_INTERVAL", "60"))
+REFRESH_AHEAD_USERS = int(os.getenv("REFRESH_AHEAD_USERS", "1000"))
+# доля TTL, меньше которой ключ горячего пользователя перезагружается заранее
+REFRESH_AHEAD_WINDOW = float(os.getenv("REFRESH_AHEAD_WINDOW", "0.1"))
+
+metrics = defaultdict(float)
+hot_users = Counter()
+
+
+class TTLCache:
+    """Небольшой in-process LRU с временем жизни записей.
+
+    Если задан maxbytes, учитывается суммарный размер значений (size в set)
+    и старые записи вытесняются, пока кеш не уложится в лимит.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, maxbytes: Optional[int] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.size = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at, _ = item
+        if expires_at < time.monotonic():
+            self.delete(key)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, size: int = 0):
+        self.delete(key)
+        self._data[key] = (value, time.monotonic() + self.ttl, size)
+        self.size += size
+        while len(self._data) > self.maxsize or (self.maxbytes is not None and self.size > self.maxbytes):
+            _, (_, _, evicted_size) = self._data.popitem(last=False)
+            self.size -= evicted_size
+
+    def delete(self, key):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self.size -= item[2]
+
+    def clear(self):
+        self._data.clear()
+        self.size = 0
+
+
+principal_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+local_cache = TTLCache(LOCAL_CACHE_SIZE, LOCAL_CACHE_TTL, maxbytes=LOCAL_CACHE_MAX_BYTES)
+
 
 app = FastAPI(title="User Service", 
               description="Сервис управления пользователями", 
-              version="1.0.0")
+              version="1.0.0",
+              default_response_class=ORJSONResponse)
 
 class UserModel(Base):
     __tablename__ = 'users'
@@ -51,22 +305,291 @@ class UserModel(Base):
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
-Base.metadata.create_all(bind=engine)
 
-def get_db():
-    db = SessionLocal()
-    try:
+users_table = UserModel.__table__
+USER_COLUMNS = (users_table.c.id, users_table.c.username, users_table.c.first_name, users_table.c.last_name, users_table.c.email)
+
+# горячие запросы собираются один раз и без ORM: SQLAlchemy берёт SQL из кеша
+# компиляции, asyncpg - подготовленный statement соединения, строки не гидрируются
+USER_BY_ID_QUERY = select(*USER_COLUMNS).where(users_table.c.id == bindparam("user_id"))
+USER_BY_USERNAME_QUERY = select(*USER_COLUMNS).where(users_table.c.username == bindparam("username"))
+# index-only scan по users_username_auth_idx (username) INCLUDE (id, password)
+AUTH_BY_USERNAME_QUERY = select(users_table.c.id, users_table.c.username, users_table.c.password).where(
+    users_table.c.username == bindparam("username")
+)
+
+@app.on_event("startup")
+async def on_startup():
+    # индексы, pg_trgm и NOTIFY-триггеры users создаёт только migrations/users.sql:
+    # CREATE INDEX на заполненной таблице при старте каждого воркера блокировал бы запись
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    # режим, сохранённый через PUT /admin/cache-mode, важнее CACHE_MODE из окружения
+    await load_cache_mode()
+    app.state.invalidation_listener = asyncio.create_task(listen_invalidations())
+    app.state.cache_flusher = asyncio.create_task(cache.run_flusher())
+    app.state.db_change_listener = asyncio.create_task(listen_db_changes())
+    app.state.hot_users_flusher = asyncio.create_task(flush_hot_users())
+    app.state.refresh_ahead = asyncio.create_task(refresh_ahead())
+    # сервис отвечает сразу, но /health/ready ждёт окончания прогрева
+    app.state.ready = False
+    app.state.warm_up = asyncio.create_task(warm_up_cache())
+    app.state.replica_checker = asyncio.create_task(check_replicas())
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    app.state.invalidation_listener.cancel()
+    app.state.cache_flusher.cancel()
+    app.state.db_change_listener.cancel()
+    app.state.hot_users_flusher.cancel()
+    app.state.refresh_ahead.cancel()
+    app.state.warm_up.cancel()
+    app.state.replica_checker.cancel()
+    await cache.flush()
+    await redis_pubsub_client.close()
+    await engine.dispose()
+    for replica in replicas:
+        await replica.engine.dispose()
+    await redis_pool.disconnect()
+    hash_executor.shutdown(wait=False, cancel_futures=True)
+    bulk_hash_executor.shutdown(wait=False, cancel_futures=True)
+
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+async def get_read_db():
+    async with read_session() as db:
+        yield db
+
+@asynccontextmanager
+async def read_session(shared: bool = False):
+    """Сессия для чтения: реплика, если она уже проиграла нужную запись, иначе primary.
+
+    Обычное чтение ждёт только записей своего клиента. shared - результат ляжет
+    в общий кеш и достанется всем, поэтому он ждёт последней записи любого клиента.
+    """
+    session = SessionLocal
+    if replicas:
+        fence = await read_fence(shared)
+        candidates = [replica for replica in replicas if replica.healthy]
+        random.shuffle(candidates)
+        for replica in candidates:
+            if await replica_reached(replica, fence):
+                session = replica.session
+                break
+    metrics["db_reads_primary" if session is SessionLocal else "db_reads_replica"] += 1
+    async with session() as db:
+        yield db
+
+async def read_fence(shared: bool):
+    user_id = current_user_id.get()
+    if not shared and user_id is None:
+        return 0
+    key = WRITES_FENCE_KEY if shared else USER_FENCE_KEY.format(user_id)
+    try:
+        fence = await cache.guarded(lambda: redis_client.get(key))
+    except CacheUnavailable:
+        # без Redis свежесть реплики не проверить
+        return math.inf
+    return int(fence or 0)
+
+async def replica_reached(replica: Replica, fence: float):
+    if replica.replay_lsn >= fence:
+        return True
+    # фоновая проверка раз в DB_REPLICA_CHECK_INTERVAL могла отстать - спрашиваем реплику сейчас
+    if fence == math.inf:
+        return False
+    metrics["db_replica_lsn_checks"] += 1
+    try:
+        async with replica.engine.connect() as conn:
+            replica.replay_lsn = (await conn.execute(REPLICA_STATUS_SQL)).scalar() or 0
+    except Exception:
+        replica.healthy = False
+        metrics["db_replica_check_errors"] += 1
+        return False
+    return replica.replay_lsn >= fence
+
+async def fence_write(db: AsyncSession):
+    if not replicas:
+        return
+    lsn = (await db.execute(WAL_LSN_SQL)).scalar()
+    user_id = current_user_id.get()
+
+    async def store():
+        async with redis_client.pipeline(transaction=False) as pipe:
+            if user_id is not None:
+                pipe.set(USER_FENCE_KEY.format(user_id), lsn, ex=DB_REPLICA_FENCE_TTL)
+            pipe.eval(FENCE_MAX_SCRIPT, 1, WRITES_FENCE_KEY, lsn, DB_REPLICA_FENCE_TTL)
+            await pipe.execute()
+
+    try:
+        await cache.guarded(store)
+    except CacheUnavailable:
+        # пока Redis недоступен, read_fence и так отправляет чтения на primary
+        metrics["db_fence_errors"] += 1
+
+async def check_replicas():
+    while True:
+        if replicas:
+            try:
+                async with engine.connect() as conn:
+                    primary_lsn = (await conn.execute(WAL_LSN_SQL)).scalar()
+            except Exception:
+                primary_lsn = None
+            for replica in replicas:
+                try:
+                    async with replica.engine.connect() as conn:
+                        replica.replay_lsn = (await conn.execute(REPLICA_STATUS_SQL)).scalar() or 0
+                    lagging = primary_lsn is not None and primary_lsn - replica.replay_lsn > DB_REPLICA_MAX_LAG_BYTES
+                    replica.healthy = not lagging
+                except Exception:
+                    replica.healthy = False
+                    metrics["db_replica_check_errors"] += 1
+        await asyncio.sleep(DB_REPLICA_CHECK_INTERVAL)
+
+
+async def get_user(db: AsyncSession, username: str):
+    # только id, username и password - этого хватает логину, принципалу и проверке дубля
+    result = await db.execute(AUTH_BY_USERNAME_QUERY, {"username": username})
+    return result.first()
+
+async def get_user_by_id(db: AsyncSession, user_id: int):
+    result = await db.execute(select(UserModel).where(UserModel.id == user_id))
+    return result.scalars().first()
+
+async def get_user_row_by_id(db: AsyncSession, user_id: int):
+    result = await db.execute(USER_BY_ID_QUERY, {"user_id": user_id})
+    return result.mappings().first()
+
+async def get_user_row_by_username(db: AsyncSession, username: str):
+    result = await db.execute(USER_BY_USERNAME_QUERY, {"username": username})
+    return result.mappings().first()
+
+async def get_users_by_ids(db: AsyncSession, ids: List[int]):
+    result = await db.execute(select(*USER_COLUMNS).where(users_table.c.id.in_(ids)))
+    return result.all()
+
+async def get_users(db: AsyncSession):
+    result = await db.execute(select(UserModel))
+    return result.scalars().all()
+
+def escape_like(value: str):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def name_prefix_query(column, prefix: str, limit: int):
+    # btree по lower(column) COLLATE "C" отдаёт строки уже в порядке сортировки,
+    # скан останавливается после limit совпадений
+    key = func.lower(column).collate("C")
+    return select(*USER_COLUMNS, key.label("sort_key")).where(
+        key.like(prefix, escape="\\")
+    ).order_by(key, users_table.c.id).limit(limit)
+
+async def get_users_by_name_prefix(db: AsyncSession, name_mask: str, limit: int):
+    # короткая маска ищется только как префикс имени или фамилии
+    prefix = escape_like(name_mask.lower()) + "%"
+    matches = union_all(
+        name_prefix_query(users_table.c.first_name, prefix, limit),
+        name_prefix_query(users_table.c.last_name, prefix, limit),
+    ).subquery()
+    result = await db.execute(select(*matches.c).order_by(matches.c.sort_key, matches.c.id).limit(2 * limit))
+    users = {}
+    for row in result:
+        users.setdefault(row.id, row)
+    return list(users.values())[:limit]
+
+async def get_users_by_name(db: AsyncSession, name_mask: str, limit: int = NAME_SEARCH_LIMIT):
+    if len(name_mask) < NAME_SEARCH_MIN_TRGM:
+        return await get_users_by_name_prefix(db, name_mask, limit)
+    # ILIKE и <% (word_similarity) обслуживаются GIN-индексами pg_trgm,
+    # <% дополнительно находит имена с опечатками
+    mask = escape_like(name_mask)
+    contains = f"%{mask}%"
+    prefix = f"{mask}%"
+    is_prefix = case(
+        (UserModel.first_name.ilike(prefix, escape="\\") | UserModel.last_name.ilike(prefix, escape="\\"), 1),
+        else_=0,
+    )
+    similarity = func.greatest(
+        func.word_similarity(name_mask, UserModel.first_name),
+        func.word_similarity(name_mask, UserModel.last_name),
+    )
+    result = await db.execute(
+        select(*USER_COLUMNS).where(
+            UserModel.first_name.ilike(contains, escape="\\") |
+            UserModel.last_name.ilike(contains, escape="\\") |
+            literal(name_mask).op("<%")(UserModel.first_name) |
+            literal(name_mask).op("<%")(UserModel.last_name)
+        ).order_by(is_prefix.desc(), similarity.desc(), UserModel.id).limit(limit)
+    )
+    return result.all()
+
+def user_to_dict(db_user: UserModel):
+    return {
+        "id": db_user.id,
+        "username": db_user.username,
+        "first_name": db_user.first_name,
+        "last_name": db_user.last_name,
+        "email": db_user.email
+    }
+
+async def load_user_by_id(user_id: int):
+    # загрузчики кеша открывают свою сессию: результат ждут и другие запросы
+    async with read_session(shared=True) as db:
+        row = await get_user_row_by_id(db, user_id)
+    return dict(row) if row else None
+
+async def load_user_by_username(username: str):
+    async with read_session(shared=True) as db:
+        row = await get_user_row_by_username(db, username)
+    return dict(row) if row else None
+
+async def load_users_by_name(name_mask: str, limit: int):
+    async with read_session(shared=True) as db:
+        users = await get_users_by_name(db, name_mask, limit)
+    return [user_to_dict(user) for user in users]
+
+async def add_user(db: AsyncSession, db_user: UserModel):
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    await fence_write(db)
+    return db_user
+
+async def remove_user(db: AsyncSession, db_user: UserModel):
+    await db.delete(db_user)
+    await db.commit()
+    await fence_write(db)
+
+async def get_taken_usernames_and_emails(db: AsyncSession, usernames: List[str], emails: List[str]):
+    result = await db.execute(
+        select(UserModel.username, UserModel.email).where(
+            UserModel.username.in_(usernames) | UserModel.email.in_(emails)
+        )
+    )
+    rows = result.all()
+    return {row.username for row in rows}, {row.email for row in rows}
+
+async def copy_users(db: AsyncSession, records: list):
+    # COPY через asyncpg в рамках транзакции сессии, id выдаёт sequence
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        UserModel.__tablename__, records=records, columns=BULK_COPY_COLUMNS
+    )
+    result = await db.execute(
+        select(UserModel.id, UserModel.username).where(UserModel.username.in_([record[0] for record in records]))
+    )
+    await db.commit()
+    await fence_write(db)
+    return result.all()
 
 
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 
 class User(BaseModel):
     id: Optional[int] = None
@@ -103,20 +626,84 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     username: str
 
-def verify_password(plain_password, password):
-    return pwd_context.verify(plain_password, password)  
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+class Principal(BaseModel):
+    id: int
+    username: str
+
+
+class UserBatchRequest(BaseModel):
+    ids: List[int] = Field(..., min_items=1, max_items=BATCH_POST_MAX_IDS)
 
-def get_user(db: Session, username: str):
-    return db.query(UserModel).filter(UserModel.username == username).first()
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = get_user(db, username)
+class CacheModeRequest(BaseModel):
+    mode: Literal[CACHE_MODES]
+
+
+class CacheModeResponse(BaseModel):
+    mode: str
+    write_behind_pending: int
+
+
+class BulkImportError(BaseModel):
+    row: int
+    error: str
+
+
+class BulkImportResult(BaseModel):
+    created: int
+    failed: int
+    errors: List[BulkImportError]
+    elapsed_seconds: float
+    users_per_second: float
+
+async def run_password_job(job, *args):
+    global hash_in_flight
+    if hash_in_flight >= HASH_WORKERS + HASH_QUEUE_LIMIT:
+        metrics["hash_rejected"] += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Password hashing is overloaded, try again later",
+            headers={"Retry-After": "1"},
+        )
+    hash_in_flight += 1
+    submitted = time.perf_counter()
+    try:
+        result, hash_time = await asyncio.get_running_loop().run_in_executor(hash_executor, job, *args)
+    finally:
+        hash_in_flight -= 1
+    metrics["hash_jobs"] += 1
+    metrics["hash_time_seconds"] += hash_time
+    metrics["hash_queue_wait_seconds"] += time.perf_counter() - submitted - hash_time
+    return result
+
+async def verify_password(plain_password, password):
+    return await run_password_job(verify_password_job, plain_password, password)
+
+async def get_password_hash(password):
+    return await run_password_job(hash_password_job, password)
+
+async def get_password_hashes(passwords: List[str]):
+    # куски по BULK_HASH_CHUNK в bulk_hash_executor; очередь - внутри пула
+    loop = asyncio.get_running_loop()
+    chunks = [passwords[i:i + BULK_HASH_CHUNK] for i in range(0, len(passwords), BULK_HASH_CHUNK)]
+    results = await asyncio.gather(*(
+        loop.run_in_executor(bulk_hash_executor, hash_passwords_job, chunk) for chunk in chunks
+    ))
+    metrics["bulk_hash_jobs"] += len(results)
+    metrics["bulk_hash_time_seconds"] += sum(hash_time for _, hash_time in results)
+    return [hashed for chunk, _ in results for hashed in chunk]
+
+async def lock_user_inserts(db: AsyncSession):
+    # users.username не уникален в схеме: проверка занятости и INSERT/COPY
+    # выполняются под этой блокировкой до конца транзакции
+    await db.execute(text("SELECT pg_advisory_xact_lock(hashtext('users_insert'))"))
+
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await get_user(db, username)
     if not user:
         return False
-    if not verify_password(password, user.password):
+    if not await verify_password(password, user.password):
         return False
     return user
 
@@ -130,7 +717,751 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_generation(family: str):
+    return int(await redis_client.get(f"cache:gen:{family}") or 0)
+
+inflight_loads = {}
+# сглаженное время загрузки из БД по семействам ключей, нужно для раннего обновления
+load_time_estimate = defaultdict(lambda: 0.01)
+
+def key_family(key: str):
+    return key.rsplit(":", 1)[0]
+
+async def cache_get_or_load(key: str, loader, ttl: int = USER_CACHE_TTL):
+    async with redis_client.pipeline(transaction=False) as pipe:
+        raw, pttl = await pipe.get(key).pttl(key).execute()
+    if raw is None:
+        metrics["cache_l2_misses"] += 1
+        return await load_single_flight(key, loader, ttl)
+
+    metrics["cache_l2_hits"] += 1
+    value = remember_local(key, raw)
+    if should_refresh_early(key, pttl):
+        metrics["cache_early_refreshes"] += 1
+        # фоновая загрузка без ожидания: её ошибку забирает forget_load
+        start_load(key, loader, ttl)
+    return unwrap_missing(value)
+
+def remember_local(key: str, raw: bytes):
+    # в L1 лежат готовые байты ответа, чтобы попадание не разбирало JSON заново
+    value = MISSING if raw == TOMBSTONE else decode_value(raw)
+    local_cache.set(key, value, size=len(TOMBSTONE if value is MISSING else value))
+    return value
+
+def unwrap_missing(value):
+    if value is MISSING:
+        metrics["cache_negative_hits"] += 1
+        return None
+    return value
+
+def should_refresh_early(key: str, pttl: int):
+    # XFetch: чем ближе истечение TTL и дольше загрузка, тем выше шанс
+    # обновить ключ заранее одним запросом, не дожидаясь промаха у всех
+    if pttl is None or pttl < 0:
+        return False
+    delta = load_time_estimate[key_family(key)]
+    return -delta * CACHE_EARLY_REFRESH_BETA * math.log(1.0 - random.random()) * 1000 >= pttl
+
+def start_load(key: str, loader, ttl: int):
+    task = inflight_loads.get(key)
+    if task is None:
+        task = asyncio.create_task(load_with_lock(key, loader, ttl))
+        inflight_loads[key] = task
+        task.add_done_callback(lambda done: forget_load(key, done))
+    else:
+        metrics["cache_coalesced"] += 1
+    return task
+
+def load_single_flight(key: str, loader, ttl: int):
+    # отмена одного ожидающего запроса не отменяет общую загрузку
+    return asyncio.shield(start_load(key, loader, ttl))
+
+def forget_load(key: str, task: asyncio.Task):
+    inflight_loads.pop(key, None)
+    if not task.cancelled() and task.exception() is not None:
+        metrics["cache_load_errors"] += 1
+
+async def load_with_lock(key: str, loader, ttl: int):
+    lock_key = f"lock:{key}"
+    token = uuid.uuid4().hex
+    if await redis_client.set(lock_key, token, nx=True, px=CACHE_LOCK_TTL_MS):
+        try:
+            return await load_and_store(key, loader, ttl)
+        finally:
+            await redis_client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+    # ключ грузит другой процесс - ждём его результат, а не идём в БД параллельно
+    metrics["cache_lock_waits"] += 1
+    deadline = time.monotonic() + CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+        raw = await redis_client.get(key)
+        if raw is not None:
+            return unwrap_missing(remember_local(key, raw))
+    return await load_and_store(key, loader, ttl)
+
+async def load_and_store(key: str, loader, ttl: int):
+    versions = await read_versions([key])
+    started = time.perf_counter()
+    value = await loader()
+    family = key_family(key)
+    load_time_estimate[family] = 0.8 * load_time_estimate[family] + 0.2 * (time.perf_counter() - started)
+    stored = await cache_set(key, value if value is not None else MISSING, versions, ttl)
+    if stored is None:
+        # ключ записали во время загрузки: ответ отдаётся, но в кеш не попадает
+        return orjson.dumps(value) if value is not None else None
+    return None if stored is MISSING else stored
+
+def jittered(ttl: int):
+    return max(1, int(ttl * random.uniform(1 - CACHE_TTL_JITTER, 1 + CACHE_TTL_JITTER)))
+
+def encode_value(value, encoding: str = CACHE_ENCODING):
+    """Пользователь или список пользователей -> байты для Redis.
+
+    JSON пишется как есть (это уже тело ответа), msgpack - с префиксом m,
+    большие значения сжимаются zlib и получают префикс z.
+    """
+    if encoding == "msgpack":
+        if isinstance(value, dict):
+            packed = [value[field] for field in USER_FIELDS]
+        else:
+            packed = [[user[field] for field in USER_FIELDS] for user in value]
+        raw = b"m" + msgpack.packb(packed)
+    else:
+        raw = orjson.dumps(value)
+    if len(raw) >= CACHE_COMPRESS_MIN_BYTES:
+        raw = b"z" + zlib.compress(raw)
+    return raw
+
+def decode_value(raw: bytes):
+    # читает любой формат, поэтому CACHE_ENCODING можно менять без сброса Redis
+    if raw[:1] == b"z":
+        raw = zlib.decompress(raw[1:])
+    if raw[:1] == b"m":
+        packed = msgpack.unpackb(raw[1:])
+        if packed and isinstance(packed[0], list):
+            return orjson.dumps([dict(zip(USER_FIELDS, row)) for row in packed])
+        return orjson.dumps(dict(zip(USER_FIELDS, packed)))
+    return raw
+
+def encode_cached(value, ttl: int = USER_CACHE_TTL):
+    # MISSING записывается как отметка отсутствия с коротким TTL
+    if value is MISSING:
+        return TOMBSTONE, jittered(NEGATIVE_CACHE_TTL)
+    return encode_value(value), jittered(ttl)
+
+def version_key(key: str):
+    return f"cache:ver:{key}"
+
+async def read_versions(keys: List[str]):
+    # читаются до обращения к БД; ключ -> (ключ, чья версия его стережёт, версия)
+    values = await redis_client.mget([version_key(key) for key in keys])
+    return {key: (key, value) for key, value in zip(keys, values)}
+
+async def cache_set(key: str, value, versions: dict, ttl: int = USER_CACHE_TTL):
+    stored = await cache_set_many({key: value}, versions, ttl)
+    return stored.get(key)
+
+async def cache_set_many(entries: dict, versions: dict, ttl: int = USER_CACHE_TTL):
+    """Результаты загрузчиков -> Redis и L1 одним скриптом.
+
+    Ключ, версия которого изменилась после read_versions, не перезаписывается
+    и не попадает в результат: в нём уже значение более поздней записи.
+    """
+    keys, args, encoded = [], [], {}
+    for key, value in entries.items():
+        guard, version = versions[key]
+        raw, ex = encode_cached(value, ttl)
+        keys += [key, version_key(guard)]
+        args += [version or "", raw, ex]
+        encoded[key] = raw
+    flags = await redis_client.eval(CACHE_SET_IF_UNCHANGED_SCRIPT, len(keys), *keys, *args)
+    stored = {}
+    for (key, raw), flag in zip(encoded.items(), flags):
+        if flag:
+            stored[key] = remember_local(key, raw)
+        else:
+            metrics["cache_stale_loads_dropped"] += 1
+    return stored
+
+async def cache_write_through(entries: dict, delete: tuple = (), families: tuple = ()):
+    """Все изменения кеша после записи в БД одной транзакцией MULTI/EXEC.
+
+    delete удаляются, entries записываются (MISSING - отметка отсутствия),
+    для families увеличивается номер поколения: ключи семейства содержат его,
+    поэтому старые списки и результаты поиска сразу перестают читаться.
+    Изменённые ключи публикуются в канал инвалидации для L1 других воркеров.
+    """
+    changed = list(delete) + list(entries)
+    encoded = {key: encode_cached(value) for key, value in entries.items()}
+    async with redis_client.pipeline(transaction=True) as pipe:
+        if delete:
+            pipe.delete(*delete)
+        for key, (raw, ex) in encoded.items():
+            pipe.set(key, raw, ex=ex)
+        for key in changed:
+            pipe.incr(version_key(key))
+            pipe.expire(version_key(key), CACHE_VERSION_TTL)
+        for family in families:
+            pipe.incr(f"cache:gen:{family}")
+        if changed:
+            pipe.publish(CACHE_INVALIDATION_CHANNEL, json.dumps({"sender": WORKER_ID, "keys": changed}))
+        await pipe.execute()
+
+    drop_local(delete)
+    for key, (raw, _) in encoded.items():
+        remember_local(key, raw)
+
+async def get_users_batch(ids: List[int]):
+    found = {}
+    remote_ids = []
+    for user_id in dict.fromkeys(ids):
+        value = local_cache.get(f"user:id:{user_id}")
+        if value is not None:
+            metrics["cache_l1_hits"] += 1
+            found[user_id] = value
+        else:
+            metrics["cache_l1_misses"] += 1
+            remote_ids.append(user_id)
+
+    use_redis = cache.mode != "off"
+    raws = []
+    versions = {}
+    if remote_ids and use_redis:
+        keys = [f"user:id:{user_id}" for user_id in remote_ids]
+        try:
+            # версии читаются тем же MGET, до похода в БД за промахами
+            values = await cache.guarded(lambda: redis_client.mget(keys + [version_key(key) for key in keys]))
+        except CacheUnavailable:
+            use_redis = False
+        else:
+            raws = values[:len(keys)]
+            versions = {key: (key, version) for key, version in zip(keys, values[len(keys):])}
+
+    missing_ids = []
+    if remote_ids and not use_redis:
+        missing_ids = remote_ids
+    elif remote_ids:
+        for user_id, raw in zip(remote_ids, raws):
+            if raw is None:
+                metrics["cache_l2_misses"] += 1
+                missing_ids.append(user_id)
+            else:
+                metrics["cache_l2_hits"] += 1
+                found[user_id] = remember_local(f"user:id:{user_id}", raw)
+
+    if missing_ids:
+        async with read_session(shared=True) as db:
+            db_users = await get_users_by_ids(db, missing_ids)
+        loaded = {db_user.id: user_to_dict(db_user) for db_user in db_users}
+        stored = {}
+        if use_redis:
+            entries = {f"user:id:{user_id}": loaded.get(user_id, MISSING) for user_id in missing_ids}
+            try:
+                stored = await cache.guarded(lambda: cache_set_many(entries, versions))
+            except CacheUnavailable:
+                pass
+        for user_id in missing_ids:
+            found[user_id] = stored.get(f"user:id:{user_id}") or (
+                orjson.dumps(loaded[user_id]) if user_id in loaded else MISSING
+            )
+
+    for user_id in ids:
+        if found[user_id] is not MISSING:
+            record_access(user_id)
+    return [unwrap_missing(found[user_id]) for user_id in ids]
+
+def json_response(raw: bytes):
+    # тело уже в финальном виде, повторная валидация response_model не нужна
+    return Response(content=raw, media_type="application/json")
+
+def json_array_response(items: list):
+    return json_response(b"[" + b",".join(b"null" if item is None else item for item in items) + b"]")
+
+def drop_local(keys):
+    for key in keys:
+        local_cache.delete(key)
+        principal_cache.delete(key)
+
+async def listen_invalidations():
+    # сообщения от других воркеров сбрасывают их копии ключей в L1
+    while True:
+        try:
+            pubsub = redis_pubsub_client.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+            # смена режима могла прийти, пока подписки не было
+            await load_cache_mode()
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                event = json.loads(message["data"])
+                if event["sender"] == WORKER_ID:
+                    continue
+                if "mode" in event:
+                    await cache.set_mode(event["mode"])
+                else:
+                    metrics["cache_invalidations_received"] += 1
+                    drop_local(event["keys"])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # пока подписка лежит, сообщения теряются - L1 целиком сбрасывается
+            metrics["cache_invalidation_errors"] += 1
+            local_cache.clear()
+            principal_cache.clear()
+            await asyncio.sleep(1)
+
+class CacheUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Размыкатель для Redis.
+
+    closed - запросы идут в Redis; после failure_threshold ошибок подряд -> open.
+    open - Redis не трогаем; через reset_timeout один запрос идёт пробным (half-open),
+    успех замыкает размыкатель, ошибка снова размыкает.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self):
+        if self.state == "closed":
+            return True
+        # зависший пробный запрос не блокирует следующий дольше reset_timeout
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half-open"
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def success(self):
+        if self.state != "closed":
+            metrics["cache_breaker_closed"] += 1
+        self.state = "closed"
+        self.failures = 0
+
+    def failure(self):
+        self.failures += 1
+        metrics["cache_breaker_failures"] += 1
+        if self.state == "half-open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                metrics["cache_breaker_opened"] += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker(CACHE_BREAKER_FAILURES, CACHE_BREAKER_RESET)
+
+
+def is_pool_exhausted(exc: Exception):
+    # так BlockingConnectionPool сообщает, что за REDIS_POOL_TIMEOUT соединение не освободилось
+    return isinstance(exc, RedisConnectionError) and str(exc) == "No connection available."
+
+
+class CacheStrategy:
+    """Через этот объект эндпоинты читают и обновляют кеш пользователей.
+
+    off           - чтение из БД, запись только сбрасывает ключи;
+    read-through  - чтение через L1/Redis, запись сбрасывает ключи;
+    write-through - запись сразу кладёт новые значения в Redis (MULTI/EXEC);
+    write-behind  - как write-through, но Redis обновляется фоновой задачей пачками.
+
+    Ключи сбрасываются во всех режимах, поэтому режим можно менять на лету.
+    Обращения к Redis идут через breaker: при ошибках чтение уходит в БД,
+    а ключи несостоявшихся записей сбрасываются, когда Redis вернётся.
+    """
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.pending = []
+        self.dirty_keys = set()
+        self.dirty_families = set()
+
+    async def guarded(self, operation):
+        if not breaker.allow():
+            metrics["cache_breaker_rejected"] += 1
+            raise CacheUnavailable()
+        try:
+            if self.dirty_keys or self.dirty_families:
+                await self.purge_dirty()
+            result = await operation()
+        except RedisError as exc:
+            if is_pool_exhausted(exc):
+                # Redis исправен, просто все соединения заняты - размыкать нечего
+                metrics["cache_pool_exhausted"] += 1
+            elif not getattr(exc, "breaker_counted", False):
+                # ошибку общей загрузки получают все её ожидающие, считается она один раз
+                exc.breaker_counted = True
+                breaker.failure()
+            raise CacheUnavailable() from exc
+        breaker.success()
+        return result
+
+    def mark_dirty(self, keys, families):
+        drop_local(keys)
+        self.dirty_keys.update(keys)
+        self.dirty_families.update(families)
+
+    async def purge_dirty(self):
+        keys, families = set(self.dirty_keys), set(self.dirty_families)
+        await cache_write_through({}, delete=tuple(keys), families=tuple(families))
+        self.dirty_keys -= keys
+        self.dirty_families -= families
+        metrics["cache_dirty_purged"] += len(keys)
+
+    async def set_mode(self, mode: str, broadcast: bool = False):
+        if broadcast:
+            # сначала режим сохраняется и рассылается: без Redis его не узнают
+            # остальные воркеры, поэтому и этот воркер режим не меняет
+            await self.guarded(lambda: publish_cache_mode(mode))
+        if mode != self.mode:
+            try:
+                await self.guarded(self.flush)
+            except CacheUnavailable:
+                # ключи неотправленных записей сбросятся, когда Redis вернётся
+                self.spill_pending()
+            self.mode = mode
+            # L1 мог заполниться в прежнем режиме
+            local_cache.clear()
+            metrics["cache_mode_switches"] += 1
+
+    async def get(self, key: str, loader):
+        if self.mode != "off":
+            # L1 проверяется до breaker: попадание в память ничего не говорит о Redis
+            value = local_cache.get(key)
+            if value is not None:
+                metrics["cache_l1_hits"] += 1
+                return unwrap_missing(value)
+            metrics["cache_l1_misses"] += 1
+            try:
+                return await self.guarded(lambda: cache_get_or_load(key, loader))
+            except CacheUnavailable:
+                pass
+        metrics["cache_bypassed"] += 1
+        value = await loader()
+        return orjson.dumps(value) if value is not None else None
+
+    async def search(self, name_mask: str, limit: int, loader):
+        if self.mode != "off":
+            try:
+                return await self.guarded(lambda: self.search_cached(name_mask, limit, loader))
+            except CacheUnavailable:
+                pass
+        metrics["cache_bypassed"] += 1
+        return orjson.dumps(await loader())
+
+    async def search_cached(self, name_mask: str, limit: int, loader):
+        generation = await get_generation("users")
+        cache_key = f"users:search:v{generation}:{name_mask.lower()}:{limit}"
+        cached_data = await redis_client.get(cache_key)
+        if cached_data:
+            return decode_value(cached_data)
+
+        users_data = await loader()
+        if users_data:
+            await redis_client.setex(cache_key, jittered(SEARCH_CACHE_TTL), encode_value(users_data))
+        return orjson.dumps(users_data)
+
+    async def write(self, entries: dict, delete: tuple = (), families: tuple = ()):
+        if self.mode in ("off", "read-through"):
+            # следующее чтение загрузит ключи из БД
+            operation = lambda: cache_write_through({}, delete=tuple(delete) + tuple(entries), families=families)
+        elif self.mode == "write-through":
+            operation = lambda: cache_write_through(entries, delete=delete, families=families)
+        elif len(self.pending) >= WRITE_BEHIND_MAX_PENDING or breaker.state == "open":
+            # Redis недоступен или не успевает: вместо роста очереди ключи сбросятся при восстановлении
+            self.spill_pending()
+            self.mark_dirty(list(delete) + list(entries), families)
+            metrics["cache_write_behind_spilled"] += 1
+            return
+        else:
+            # до сброса очереди Redis отдаёт прежние значения, а этот воркер читает новые из L1
+            drop_local(delete)
+            for key, value in entries.items():
+                remember_local(key, encode_cached(value)[0])
+            self.pending.append((entries, tuple(delete), tuple(families)))
+            metrics["cache_write_behind_queued"] += 1
+            return
+        try:
+            await self.guarded(operation)
+        except CacheUnavailable:
+            # запись в БД уже прошла, запрос не падает из-за кеша
+            metrics["cache_writes_skipped"] += 1
+            self.mark_dirty(list(delete) + list(entries), families)
+
+    def spill_pending(self):
+        for op_entries, op_delete, op_families in self.pending:
+            self.mark_dirty(list(op_delete) + list(op_entries), op_families)
+        self.pending.clear()
+
+    async def flush(self):
+        while self.pending:
+            batch = self.pending[:WRITE_BEHIND_BATCH]
+            del self.pending[:WRITE_BEHIND_BATCH]
+            # операции схлопываются в одну транзакцию, побеждает последняя по ключу
+            entries, delete, families = {}, {}, set()
+            for op_entries, op_delete, op_families in batch:
+                for key in op_delete:
+                    entries.pop(key, None)
+                    delete[key] = None
+                for key, value in op_entries.items():
+                    delete.pop(key, None)
+                    entries[key] = value
+                families.update(op_families)
+            try:
+                await cache_write_through(entries, delete=tuple(delete), families=tuple(families))
+            except BaseException:
+                self.pending[:0] = batch
+                raise
+            metrics["cache_write_behind_flushes"] += 1
+
+    async def run_flusher(self):
+        while True:
+            await asyncio.sleep(WRITE_BEHIND_INTERVAL)
+            if not self.pending:
+                continue
+            try:
+                await self.guarded(self.flush)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                metrics["cache_write_behind_errors"] += 1
+
+
+cache = CacheStrategy(CACHE_MODE)
+
+async def publish_cache_mode(mode: str):
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.set(CACHE_MODE_KEY, mode)
+        pipe.publish(CACHE_INVALIDATION_CHANNEL, json.dumps({"sender": WORKER_ID, "mode": mode}))
+        await pipe.execute()
+
+async def load_cache_mode():
+    try:
+        mode = await cache.guarded(lambda: redis_client.get(CACHE_MODE_KEY))
+    except CacheUnavailable:
+        # остаётся текущий режим (при старте - CACHE_MODE)
+        return
+    if mode is not None and mode.decode() in CACHE_MODES:
+        await cache.set_mode(mode.decode())
+
+db_change_tasks = set()
+# ключи, которые сбрасываются целиком после разрыва LISTEN
+USER_KEY_PATTERNS = ("user:id:*", "user:username:*", "auth:user:*")
+
+async def listen_db_changes():
+    # отдельное соединение вне пула: LISTEN держит его всё время работы
+    missed = False
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(
+                user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT, database=DB_NAME,
+                server_settings={"application_name": f"{DB_APPLICATION_NAME}:listener"},
+            )
+            await connection.add_listener(USERS_CHANGED_CHANNEL, on_users_changed)
+            while True:
+                if missed:
+                    # сброс уже после LISTEN, чтобы между ним и новыми уведомлениями не было окна;
+                    # не удался (Redis недоступен) - повторится на следующей проверке
+                    missed = not await reset_user_cache()
+                await asyncio.sleep(DB_NOTIFY_CHECK_INTERVAL)
+                await connection.fetchval("SELECT 1")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            metrics["db_notify_errors"] += 1
+        finally:
+            if connection is not None:
+                connection.terminate()
+        # пока соединения нет, уведомления теряются
+        missed = True
+        await asyncio.sleep(1)
+
+async def purge_user_keys():
+    for pattern in USER_KEY_PATTERNS:
+        keys = []
+        async for key in redis_client.scan_iter(match=pattern, count=1000):
+            keys.append(key)
+            if len(keys) >= 1000:
+                await redis_client.unlink(*keys)
+                keys = []
+        if keys:
+            await redis_client.unlink(*keys)
+
+async def reset_user_cache():
+    # после потери уведомлений любая запись о пользователе могла устареть
+    local_cache.clear()
+    principal_cache.clear()
+    try:
+        await cache.guarded(purge_user_keys)
+        await cache.write({}, families=("users",))
+    except Exception:
+        metrics["db_notify_errors"] += 1
+        return False
+    metrics["db_notify_resets"] += 1
+    return True
+
+def on_users_changed(connection, pid, channel, payload):
+    task = asyncio.create_task(invalidate_users(orjson.loads(payload)))
+    db_change_tasks.add(task)
+    task.add_done_callback(db_change_tasks.discard)
+
+def record_access(user_id: int):
+    # счётчики копятся в памяти и уходят в Redis пачкой раз в HOT_FLUSH_INTERVAL;
+    # пока Redis недоступен, новые id сверх HOT_USERS_TRACKED не запоминаются
+    if user_id not in hot_users and len(hot_users) >= HOT_USERS_TRACKED:
+        metrics["hot_users_dropped"] += 1
+        return
+    hot_users[user_id] += 1
+
+async def flush_hot_users():
+    decayed_at = time.monotonic()
+    while True:
+        await asyncio.sleep(HOT_FLUSH_INTERVAL)
+        if breaker.state != "closed":
+            continue
+        counts = dict(hot_users)
+        hot_users.clear()
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for user_id, count in counts.items():
+                    pipe.zincrby(HOT_USERS_KEY, count, user_id)
+                pipe.zremrangebyrank(HOT_USERS_KEY, 0, -HOT_USERS_TRACKED - 1)
+                if time.monotonic() - decayed_at >= HOT_DECAY_INTERVAL:
+                    # старые обращения постепенно теряют вес
+                    pipe.zunionstore(HOT_USERS_KEY, {HOT_USERS_KEY: 0.5})
+                    decayed_at = time.monotonic()
+                await pipe.execute()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            metrics["hot_users_flush_errors"] += 1
+
+async def get_hot_user_ids(count: int):
+    return [int(user_id) for user_id in await redis_client.zrevrange(HOT_USERS_KEY, 0, count - 1)]
+
+async def load_users_into_cache(ids: List[int]):
+    # один SELECT ... IN и один скрипт SET на пачку: user:id и user:username
+    versions = await read_versions([f"user:id:{user_id}" for user_id in ids])
+    async with read_session(shared=True) as db:
+        db_users = await get_users_by_ids(db, ids)
+    loaded = {db_user.id: user_to_dict(db_user) for db_user in db_users}
+    entries = {f"user:id:{user_id}": loaded.get(user_id, MISSING) for user_id in ids}
+    for user in loaded.values():
+        # username до загрузки неизвестен; записи пользователя меняют оба ключа, стережёт версия user:id
+        entries[f"user:username:{user['username']}"] = user
+        versions[f"user:username:{user['username']}"] = versions[f"user:id:{user['id']}"]
+    await cache_set_many(entries, versions)
+    return len(loaded)
+
+async def warm_up_cache():
+    started = time.perf_counter()
+    try:
+        if cache.mode != "off":
+            ids = await get_hot_user_ids(WARMUP_USERS)
+            for start in range(0, len(ids), WARMUP_BATCH):
+                metrics["warmup_users"] += await load_users_into_cache(ids[start:start + WARMUP_BATCH])
+    except Exception:
+        # без прогрева сервис работает, просто первые запросы пойдут в БД
+        metrics["warmup_errors"] += 1
+    finally:
+        metrics["warmup_seconds"] = time.perf_counter() - started
+        app.state.ready = True
+
+async def refresh_ahead():
+    while True:
+        await asyncio.sleep(REFRESH_AHEAD_INTERVAL)
+        if cache.mode == "off" or breaker.state != "closed":
+            continue
+        try:
+            ids = await get_hot_user_ids(REFRESH_AHEAD_USERS)
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for user_id in ids:
+                    pipe.ttl(f"user:id:{user_id}")
+                ttls = await pipe.execute() if ids else []
+            # -2 - ключа нет, -1 - ключ без TTL (не наш случай, но и обновлять его незачем)
+            expiring = [user_id for user_id, ttl in zip(ids, ttls)
+                        if ttl == -2 or 0 <= ttl < USER_CACHE_TTL * REFRESH_AHEAD_WINDOW]
+            for start in range(0, len(expiring), WARMUP_BATCH):
+                await load_users_into_cache(expiring[start:start + WARMUP_BATCH])
+            metrics["refresh_ahead_users"] += len(expiring)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            metrics["refresh_ahead_errors"] += 1
+
+async def invalidate_users(rows: list):
+    keys = []
+    for user_id, username in rows:
+        keys += [f"user:id:{user_id}", f"user:username:{username}", f"auth:user:{username}"]
+    try:
+        if replicas:
+            # перезагрузка сброшенных ключей не должна прочитать старую строку с реплики
+            async with SessionLocal() as db:
+                await fence_write(db)
+        await cache.write({}, delete=tuple(keys), families=("users",))
+    except Exception:
+        metrics["db_notify_errors"] += 1
+        return
+    metrics["db_notify_invalidated_users"] += len(rows)
+
+async def get_principal(username: str):
+    cache_key = f"auth:user:{username}"
+    principal = principal_cache.get(cache_key)
+    if principal is not None:
+        metrics["principal_l1_hits"] += 1
+        return principal
+
+    try:
+        cached, version = await cache.guarded(lambda: redis_client.mget([cache_key, version_key(cache_key)]))
+    except CacheUnavailable:
+        cached, version = None, None
+    if cached:
+        metrics["principal_l2_hits"] += 1
+        principal = Principal(**json.loads(cached))
+        principal_cache.set(cache_key, principal)
+        return principal
+
+    metrics["principal_misses"] += 1
+    # сессия открывается только на промахе обоих уровней кеша
+    async with read_session(shared=True) as db:
+        user = await get_user(db, username=username)
+    if user is None:
+        return None
+    return await cache_principal(user, version)
+
+async def read_principal_version(username: str):
+    cache_key = f"auth:user:{username}"
+    try:
+        return await cache.guarded(lambda: redis_client.get(version_key(cache_key)))
+    except CacheUnavailable:
+        return None
+
+async def cache_principal(user, version):
+    # version - версия auth:user:{username}, прочитанная до чтения пользователя из БД
+    cache_key = f"auth:user:{user.username}"
+    principal = Principal(id=user.id, username=user.username)
+    try:
+        stored = await cache.guarded(lambda: redis_client.eval(
+            CACHE_SET_IF_UNCHANGED_SCRIPT, 2, cache_key, version_key(cache_key),
+            version or "", principal.json(), jittered(ACCESS_TOKEN_EXPIRE_MINUTES * 60),
+        ))
+    except CacheUnavailable:
+        stored = [1]
+    if stored[0]:
+        principal_cache.set(cache_key, principal)
+    else:
+        metrics["cache_stale_loads_dropped"] += 1
+    return principal
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -145,21 +1476,24 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except jwt.PyJWTError:
         raise credentials_exception
     
-    user = get_user(db, username=token_data.username)
-    if user is None:
+    principal = await get_principal(token_data.username)
+    if principal is None:
         raise credentials_exception
-    return user
+    current_user_id.set(principal.id)
+    return principal
 
 
 @app.post("/token", response_model=Token, tags=["auth"])
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    version = await read_principal_version(form_data.username)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    await cache_principal(user, version)
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
@@ -167,15 +1501,24 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/users/", response_model=UserResponse, tags=["users"])
-async def create_user(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = get_user(db, username=user.username)
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    # первая проверка только экономит bcrypt на занятом имени; транзакция
+    # закрывается до хеширования, окончательная проверка - под блокировкой
+    db_user = await get_user(db, username=user.username)
+    await db.rollback()
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered"
         )
     
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
+    await lock_user_inserts(db)
+    if await get_user(db, username=user.username):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Username already registered"
+        )
     db_user = UserModel(
         username=user.username,
         password=hashed_password,
@@ -184,123 +1527,203 @@ async def create_user(user: UserCreate, db: Session = Depends(get_db)):
         email=user.email
     )  
     
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    db_user = await add_user(db, db_user)
     
-    user_dict = {
-        "id": db_user.id,
-        "username": db_user.username,
-        "first_name": db_user.first_name,
-        "last_name": db_user.last_name,
-        "email": db_user.email
-    }
-    cache_key = f"user:id:{db_user.id}"
-    redis_client.set(cache_key, json.dumps(user_dict), ex=3600)
-    
-    redis_client.delete("users:all")
+    user_data = user_to_dict(db_user)
+    await cache.write(
+        {f"user:id:{db_user.id}": user_data, f"user:username:{db_user.username}": user_data},
+        families=("users",),
+    )
     
     return db_user
 
 
+def parse_bulk_rows(text_body: str, content_type: str):
+    # строка - словарь полей или текст ошибки для этой строки
+    if "csv" in content_type:
+        for row_number, row in enumerate(csv.DictReader(io.StringIO(text_body)), start=1):
+            # лишние значения DictReader складывает под ключ None
+            yield row_number, row if None not in row else "Row has more fields than the header"
+        return
+    for row_number, line in enumerate(text_body.splitlines(), start=1):
+        if line.strip():
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row_number, row if isinstance(row, dict) else "Row is not a JSON object"
+
+def reject_taken(batch: list, taken_usernames: set, taken_emails: set, errors: list):
+    accepted = []
+    seen_usernames, seen_emails = set(), set()
+    for row_number, user in batch:
+        if user.username in taken_usernames or user.username in seen_usernames:
+            errors.append(BulkImportError(row=row_number, error="Username already registered"))
+        elif user.email in taken_emails or user.email in seen_emails:
+            errors.append(BulkImportError(row=row_number, error="Email already registered"))
+        else:
+            seen_usernames.add(user.username)
+            seen_emails.add(user.email)
+            accepted.append((row_number, user))
+    return accepted
+
+async def import_users_batch(db: AsyncSession, batch: list, errors: list):
+    # предварительная проверка отсеивает занятые имена до bcrypt и сразу закрывает транзакцию
+    taken = await get_taken_usernames_and_emails(
+        db, [user.username for _, user in batch], [user.email for _, user in batch]
+    )
+    await db.rollback()
+    accepted = reject_taken(batch, *taken, errors)
+    if not accepted:
+        return 0
+
+    try:
+        # хеширование - вне транзакции, соединение не висит idle in transaction
+        hashes = await get_password_hashes([user.password for _, user in accepted])
+        hashed = {row_number: password for (row_number, _), password in zip(accepted, hashes)}
+
+        # повторная проверка и COPY - одна короткая транзакция под блокировкой вставок
+        await lock_user_inserts(db)
+        taken = await get_taken_usernames_and_emails(
+            db, [user.username for _, user in accepted], [user.email for _, user in accepted]
+        )
+        accepted = reject_taken(accepted, *taken, errors)
+        if not accepted:
+            await db.rollback()
+            return 0
+        now = datetime.utcnow()
+        records = [
+            (user.username, hashed[row_number], user.first_name, user.last_name, user.email, now, now)
+            for row_number, user in accepted
+        ]
+        created = await copy_users(db, records)
+    except Exception as exc:
+        await db.rollback()
+        detail = exc.detail if isinstance(exc, HTTPException) else str(exc)
+        errors.extend(BulkImportError(row=row_number, error=detail) for row_number, _ in accepted)
+        return 0
+
+    keys = [f"user:id:{row.id}" for row in created] + [f"user:username:{row.username}" for row in created]
+    await cache.write({}, delete=tuple(keys), families=("users",))
+    return len(created)
+
+@app.post("/users/bulk", response_model=BulkImportResult, tags=["users"])
+async def import_users(request: Request, current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    started = time.perf_counter()
+    content_type = request.headers.get("content-type", "")
+    body = await request.body()
+    try:
+        text_body = body.decode("utf-8")
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Body must be UTF-8 encoded"
+        )
+
+    # лимит проверяется до первой пачки: иначе часть пользователей уже была бы записана
+    rows = list(parse_bulk_rows(text_body, content_type))
+    if len(rows) > BULK_MAX_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {BULK_MAX_ROWS} rows per import"
+        )
+
+    created = 0
+    errors = []
+    batch = []
+    for row_number, row in rows:
+        if isinstance(row, str):
+            errors.append(BulkImportError(row=row_number, error=row))
+            continue
+        try:
+            batch.append((row_number, UserCreate(**row)))
+        except ValidationError as exc:
+            message = "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in exc.errors())
+            errors.append(BulkImportError(row=row_number, error=message))
+            continue
+        if len(batch) >= BULK_BATCH_SIZE:
+            created += await import_users_batch(db, batch, errors)
+            batch = []
+    if batch:
+        created += await import_users_batch(db, batch, errors)
+
+    elapsed = time.perf_counter() - started
+    metrics["bulk_imported_users"] += created
+    return BulkImportResult(
+        created=created,
+        failed=len(errors),
+        errors=sorted(errors, key=lambda error: error.row),
+        elapsed_seconds=elapsed,
+        users_per_second=created / elapsed if elapsed else 0.0,
+    )
+
+
 @app.get("/users/", response_model=List[UserResponse], tags=["users"])
-async def read_users(current_user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
-    users = db.query(UserModel).all()
+async def read_users(current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    users = await get_users(db)
     return users
 
-@app.get("/users/{user_id}", response_model=UserResponse, tags=["users"])
-async def read_user(user_id: int, current_user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
-
-    cache_key = f"user:id:{user_id}"
-    cached_user = redis_client.get(cache_key)
-    
-    if cached_user:
-        user_data = json.loads(cached_user)
-        return UserResponse(
-            id=user_data["id"],
-            username=user_data["username"],
-            first_name=user_data["first_name"],
-            last_name=user_data["last_name"],
-            email=user_data["email"]
+@app.get("/users/batch", response_model=List[Optional[UserResponse]], tags=["users"])
+async def read_users_batch(
+    ids: str = Query(..., description="id через запятую, 1,2,3"),
+    current_user: Principal = Depends(get_current_user)
+):
+    try:
+        user_ids = [int(user_id) for user_id in ids.split(",") if user_id.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="ids must be a comma-separated list of integers"
         )
-    
-    db_user = db.query(UserModel).filter(UserModel.id == user_id).first()
-    if not db_user:
+    if not user_ids or len(user_ids) > BATCH_GET_MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"ids must contain from 1 to {BATCH_GET_MAX_IDS} items, use POST /users/batch for more"
+        )
+    return json_array_response(await get_users_batch(user_ids))
+
+@app.post("/users/batch", response_model=List[Optional[UserResponse]], tags=["users"])
+async def read_users_batch_post(request: UserBatchRequest, current_user: Principal = Depends(get_current_user)):
+    return json_array_response(await get_users_batch(request.ids))
+
+@app.get("/users/{user_id}", response_model=UserResponse, tags=["users"])
+async def read_user(user_id: int, current_user: Principal = Depends(get_current_user)):
+    user = await cache.get(f"user:id:{user_id}", lambda: load_user_by_id(user_id))
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
-    
-    user_dict = {
-        "id": db_user.id,
-        "username": db_user.username,
-        "first_name": db_user.first_name,
-        "last_name": db_user.last_name,
-        "email": db_user.email
-    }
-    redis_client.set(cache_key, json.dumps(user_dict), ex=3600) 
-    return db_user
+    # несуществующие id не попадают в users:hot и в прогрев
+    record_access(user_id)
+    return json_response(user)
 
 @app.get("/users/by-username/{username}", response_model=UserResponse, tags=["users"])
 async def read_user_by_username(
     username: str, 
-    current_user: UserModel = Depends(get_current_user), 
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user)
 ):
-    cache_key = f"user:username:{username}"
-    cached_user = redis_client.get(cache_key)
-    
-    if cached_user:
-        return UserResponse(**json.loads(cached_user))
-    
-    db_user = db.query(UserModel).filter(UserModel.username == username).first()
-    
-    if not db_user:
+    user = await cache.get(f"user:username:{username}", lambda: load_user_by_username(username))
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
-    
-    user_data = {
-        "id": db_user.id,
-        "username": db_user.username,
-        "first_name": db_user.first_name,
-        "last_name": db_user.last_name,
-        "email": db_user.email
-    }
-    redis_client.setex(cache_key, 3600, json.dumps(user_data))
-    
-    return db_user
+    return json_response(user)
 
 @app.get("/users/by-name/{name_mask}", response_model=List[UserResponse], tags=["users"])
-async def read_users_by_name(name_mask: str, current_user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
-    cache_key = f"users:search:{name_mask.lower()}"
-    
-    if redis_client.exists(cache_key):
-        cached_data = redis_client.get(cache_key)
-        return [UserResponse(**user) for user in json.loads(cached_data)]
-    
-    users = db.query(UserModel).filter(
-        (UserModel.first_name.ilike(f"%{name_mask}%")) | 
-        (UserModel.last_name.ilike(f"%{name_mask}%"))
-    ).all()
-    
-    if users:
-        users_data = [{
-            "id": user.id,
-            "username": user.username,
-            "first_name": user.first_name,
-            "last_name": user.last_name,
-            "email": user.email
-        } for user in users]
-        redis_client.setex(cache_key, 3600, json.dumps(users_data))  
-    
-    return users
+async def read_users_by_name(
+    name_mask: str,
+    limit: int = Query(NAME_SEARCH_LIMIT, ge=1, le=NAME_SEARCH_MAX_LIMIT),
+    current_user: Principal = Depends(get_current_user)
+):
+    users = await cache.search(name_mask, limit, lambda: load_users_by_name(name_mask, limit))
+    return json_response(users)
 
 
 @app.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT, tags=["users"])
-async def delete_user(user_id: int, current_user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
-    db_user = db.query(UserModel).filter(UserModel.id == user_id).first()
+async def delete_user(user_id: int, current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    db_user = await get_user_by_id(db, user_id)
     if not db_user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -309,12 +1732,64 @@ async def delete_user(user_id: int, current_user: UserModel = Depends(get_curren
     
     username = db_user.username
     
-    db.delete(db_user)
-    db.commit()
+    await remove_user(db, db_user)
     
-    redis_client.delete(f"user:id:{user_id}")
-    redis_client.delete(f"user:username:{username}")
-    
-    redis_client.delete("users:all")
+    await cache.write(
+        {f"user:id:{user_id}": MISSING, f"user:username:{username}": MISSING},
+        delete=(f"auth:user:{username}",),
+        families=("users",),
+    )
     
     return None
+
+
+async def get_admin_user(current_user: Principal = Depends(get_current_user)):
+    if current_user.username not in ADMIN_USERNAMES:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required"
+        )
+    return current_user
+
+@app.get("/admin/cache-mode", response_model=CacheModeResponse, tags=["admin"])
+async def read_cache_mode(current_user: Principal = Depends(get_admin_user)):
+    return CacheModeResponse(mode=cache.mode, write_behind_pending=len(cache.pending))
+
+@app.put("/admin/cache-mode", response_model=CacheModeResponse, tags=["admin"])
+async def update_cache_mode(request: CacheModeRequest, current_user: Principal = Depends(get_admin_user)):
+    # режим меняется во всех воркерах через канал инвалидации
+    try:
+        await cache.set_mode(request.mode, broadcast=True)
+    except CacheUnavailable:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Redis is unavailable, cache mode is unchanged",
+            headers={"Retry-After": "1"},
+        )
+    return CacheModeResponse(mode=cache.mode, write_behind_pending=len(cache.pending))
+
+
+@app.get("/health/ready", tags=["health"])
+async def read_readiness():
+    if not app.state.ready:
+        return ORJSONResponse({"status": "warming up"}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return {"status": "ready"}
+
+
+@app.get("/metrics", tags=["metrics"])
+async def read_metrics():
+    jobs = metrics["hash_jobs"] or 1
+    return {
+        **metrics,
+        "hash_in_flight": hash_in_flight,
+        "hash_avg_time_ms": metrics["hash_time_seconds"] / jobs * 1000,
+        "hash_avg_queue_wait_ms": metrics["hash_queue_wait_seconds"] / jobs * 1000,
+        "local_cache_items": len(local_cache),
+        "local_cache_bytes": local_cache.size,
+        "cache_mode": cache.mode,
+        "cache_write_behind_pending": len(cache.pending),
+        "hot_users_pending": len(hot_users),
+        "cache_breaker_state": breaker.state,
+        "cache_dirty_keys": len(cache.dirty_keys),
+        "db_replicas_healthy": sum(replica.healthy for replica in replicas),
+    }
@@ -0,0 +1,28 @@
+"""Задачи bcrypt для пула процессов user_service.
+
+Модуль отдельно от main.py: процессы пула запускаются через spawn и
+импортируют только его, а не FastAPI, SQLAlchemy и настройки кеша.
+"""
+import time
+
+from passlib.context import CryptContext
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def verify_password_job(plain_password, password):
+    started = time.perf_counter()
+    result = pwd_context.verify(plain_password, password)
+    return result, time.perf_counter() - started
+
+
+def hash_password_job(password):
+    started = time.perf_counter()
+    result = pwd_context.hash(password)
+    return result, time.perf_counter() - started
+
+
+def hash_passwords_job(passwords):
+    started = time.perf_counter()
+    result = [pwd_context.hash(password) for password in passwords]
+    return result, time.perf_counter() - started